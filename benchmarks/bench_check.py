@@ -0,0 +1,111 @@
+"""
+End-to-end benchmark of check() against a synthetic hub and download server.
+For each channel size and probing mode it reports wall time, hosts per
+second, hub round trips and calls, hw_info.log downloads and, with
+--memory, the peak memory allocated during the run.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_check
+    python -m benchmarks.bench_check --sizes 100 1000 --latency 0.002 --jobs 16 --memory
+"""
+import argparse
+import contextlib
+import os
+import time
+import tracemalloc
+from types import SimpleNamespace
+from unittest import mock
+import kojichannelvalidator.koji_channel_validator as cv
+from kojichannelvalidator.__main__ import build_parser
+from benchmarks.synthetic import SERVER, TOPURL, SyntheticDownloads, SyntheticHub
+
+
+def modes(jobs):
+    """
+    Returns the kcv options benchmarked, by mode name
+    """
+    return {
+        "serial": [],
+        f"jobs={jobs}": ["-j", str(jobs)],
+        f"batch,jobs={jobs}": ["-b", "-j", str(jobs)],
+        f"tiered,jobs={jobs}": ["-t", "-j", str(jobs)],
+    }
+
+
+def run(size, options, latency, memory):
+    """
+    Runs check() on a synthetic channel of size hosts with the given kcv
+    options and returns the measurements
+    """
+    hub = SyntheticHub(hosts=size, latency=latency)
+    downloads = SyntheticDownloads(latency=latency)
+    profile = SimpleNamespace(
+        config=SimpleNamespace(server=SERVER, topurl=TOPURL),
+        ClientSession=lambda server, opts: hub,
+    )
+    args = build_parser().parse_args(
+        ["-c", "synthetic", "--profile", "synthetic"] + options
+    )
+
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(
+            mock.patch("koji.get_profile_module", {"synthetic": profile}.__getitem__)
+        )
+        stack.enter_context(
+            mock.patch.object(cv, "LogSession", lambda **kwargs: downloads)
+        )
+        devnull = stack.enter_context(open(os.devnull, "w"))
+        stack.enter_context(contextlib.redirect_stdout(devnull))
+
+        if memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        cv.check(args)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if memory else None
+        if memory:
+            tracemalloc.stop()
+
+    return {
+        "seconds": elapsed,
+        "hosts_per_second": size / elapsed,
+        "round_trips": hub.round_trips,
+        "calls": sum(
+            count for method, count in hub.calls.items() if method != "multiCall"
+        ),
+        "downloads": downloads.gets,
+        "peak_mb": peak / 2**20 if memory else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds added to every hub round trip and download",
+    )
+    parser.add_argument("--jobs", type=int, default=8)
+    parser.add_argument(
+        "--memory", action="store_true", help="Measure peak memory (slower)"
+    )
+    bench_args = parser.parse_args()
+
+    print(
+        f"{'mode':<16}{'hosts':>7}{'seconds':>10}{'hosts/s':>10}{'round trips':>13}{'calls':>8}{'downloads':>11}{'peak MB':>9}"
+    )
+    for size in bench_args.sizes:
+        for name, options in modes(bench_args.jobs).items():
+            result = run(size, options, bench_args.latency, bench_args.memory)
+            peak = f"{result['peak_mb']:.1f}" if result["peak_mb"] != None else "-"
+            print(
+                f"{name:<16}{size:>7}{result['seconds']:>10.2f}{result['hosts_per_second']:>10.0f}"
+                f"{result['round_trips']:>13}{result['calls']:>8}{result['downloads']:>11}{peak:>9}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Compares parse_hw_log with the line by line re.sub parsing it replaced,
+using the hw_info.log fixtures served by FakeResponse.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_hw_log
+"""
+import re
+import timeit
+from kojichannelvalidator.hw_log import parse_hw_log
+from kojichannelvalidator.tests.util import HW_INFO_LOGS
+
+NUMBER = 2000
+
+
+def legacy_parse(hw_log_str):
+    """
+    The parsing get_hw_info did before parse_hw_log
+    """
+    hw = {"CPU(s)": None, "Ram": None, "Disk": None}
+    hw_log_lines = hw_log_str.split("\n")
+    hw_log_lines = [re.sub(r"\s+", ",", line) for line in hw_log_lines]
+
+    for line in hw_log_lines:
+        line_split = line.split(",")
+
+        if line_split[0] == "CPU(s):":
+            hw["CPU(s)"] = int(line_split[1])
+            continue
+        if line_split[0] == "Mem:":
+            hw["Ram"] = int(line_split[1])
+            continue
+        disk_match = re.match(r"^/", line_split[0])
+        if disk_match:
+            hw["Disk"] = line_split[1]
+            continue
+    return hw
+
+
+def main():
+    print(f"{'arch':<10}{'legacy us':>12}{'parse_hw_log us':>18}{'speedup':>10}")
+    for url, log in HW_INFO_LOGS.items():
+        arch = url.split("/")[-2]
+        legacy = legacy_parse(log)
+        parsed = parse_hw_log(log)
+        assert (parsed["cpus"], parsed["ram_kb"], parsed["disk"]) == (
+            legacy["CPU(s)"],
+            legacy["Ram"],
+            legacy["Disk"],
+        )
+
+        legacy_time = timeit.timeit(lambda: legacy_parse(log), number=NUMBER)
+        parse_time = timeit.timeit(lambda: parse_hw_log(log), number=NUMBER)
+        print(
+            f"{arch:<10}{legacy_time / NUMBER * 1e6:>12.1f}"
+            f"{parse_time / NUMBER * 1e6:>18.1f}{legacy_time / parse_time:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Startup benchmark of the kcv command line. Each command is run in a fresh
+interpreter and the fastest wall time is reported, along with the time
+spent importing modules and whether koji and requests were imported. The
+cache hit is answered from a check result stored in a temporary cache.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --runs 20
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from kojichannelvalidator.__main__ import build_parser
+from kojichannelvalidator.cache import HwInfoCache, result_key
+
+CACHED_CHECK = ["check", "-c", "dummy-rhel8", "--cache", "--result-ttl", "300"]
+
+
+def commands():
+    """
+    Returns the python arguments benchmarked, by name
+    """
+    return {
+        "import validator": ["-c", "import kojichannelvalidator.koji_channel_validator"],
+        "kcv --help": ["-m", "kojichannelvalidator", "--help"],
+        "kcv history --help": ["-m", "kojichannelvalidator", "history", "--help"],
+        "kcv check, cache hit": ["-m", "kojichannelvalidator"] + CACHED_CHECK,
+    }
+
+
+def run(arguments, env, runs):
+    """
+    Runs python with arguments runs times
+
+    returns the fastest wall time in seconds, the time spent importing in
+    seconds and the names of the modules imported
+    """
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + arguments, env=env, capture_output=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best == None else min(best, elapsed)
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime"] + arguments,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    modules = set()
+    import_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative, name = line[len("import time:") :].split("|")
+        if self_us.strip().isdigit():
+            import_us += int(self_us)
+            modules.add(name.strip())
+    return best, import_us / 1e6, modules
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    bench_args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_home:
+        env = dict(os.environ, XDG_CACHE_HOME=cache_home)
+        env["PYTHONPATH"] = os.pathsep.join(
+            [os.getcwd()] + [path for path in [env.get("PYTHONPATH")] if path]
+        )
+        cache = HwInfoCache(
+            path=os.path.join(cache_home, "kojichannelvalidator", "cache.sqlite")
+        )
+        args = build_parser().parse_args(CACHED_CHECK[1:])
+        cache.put_result(result_key(args), "dummy-rhel8 contains 15 hosts\n", 0)
+        cache.close()
+
+        print(f"{'command':<24}{'wall ms':>9}{'import ms':>11}{'koji':>6}{'requests':>10}")
+        for name, arguments in commands().items():
+            wall, imports, modules = run(arguments, env, bench_args.runs)
+            print(
+                f"{name:<24}{wall * 1000:>9.1f}{imports * 1000:>11.1f}"
+                f"{'yes' if 'koji' in modules else 'no':>6}"
+                f"{'yes' if 'requests' in modules else 'no':>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
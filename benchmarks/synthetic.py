@@ -0,0 +1,242 @@
+"""
+Synthetic stand-ins for a Koji hub and its download server, for running the
+validator offline against channels of any size.
+
+SyntheticHub answers the hub calls the validator makes from generated hosts,
+tasks, builds and build logs, and counts every call and round trip.
+SyntheticDownloads serves the matching hw_info.log files. Both can inject a
+fixed latency per round trip.
+"""
+import datetime
+import functools
+import random
+import threading
+import time
+from collections import Counter
+
+TOPURL = "http://download.example.com/kojiroot"
+SERVER = "http://hub.example.com/kojihub"
+
+# (arches, CPU(s), Ram kB) for the kinds of builder generated
+BUILDER_KINDS = [
+    ("x86_64 i386", 24, 32624292),
+    ("x86_64 i386", 16, 16284748),
+    ("ppc ppc64le", 8, 24050560),
+    ("aarch64", 16, 16175168),
+    ("s390x", 4, 16284748),
+]
+# Fraction of buildArch tasks generated as scratch builds
+SCRATCH_RATE = 0.3
+TASKS_PER_HOST = 12
+
+
+@functools.lru_cache(maxsize=None)
+def hw_info_log(arch, cpus, ram_kb):
+    """
+    Returns a hw_info.log in the format written by mock's hw_info plugin.
+    Logs are shared between builds with the same hardware to keep large
+    hubs small.
+    """
+    return (
+        "CPU info:\n"
+        f"Architecture:        {arch}\n"
+        "Byte Order:          Little Endian\n"
+        f"CPU(s):              {cpus}\n"
+        f"On-line CPU(s) list: 0-{cpus - 1}\n"
+        "Thread(s) per core:  2\n"
+        f"Core(s) per socket:  {max(cpus // 4, 1)}\n"
+        "Socket(s):           2\n"
+        "Model name:          Synthetic CPU @ 3.40GHz\n"
+        "Flags:               " + " ".join(f"flag{i}" for i in range(120)) + "\n"
+        "\n\n"
+        "Memory:\n"
+        "              total        used        free      shared  buff/cache   available\n"
+        f"Mem:       {ram_kb}      994276    17234720      886796    14395296    30267136\n"
+        "Swap:      16482300      835572    15646728\n"
+        "\n\n"
+        "Storage:\n"
+        "Filesystem                      Size  Used Avail Use% Mounted on\n"
+        "/dev/mapper/builder-root        581G   15G  567G   3% /\n"
+    )
+
+
+class SyntheticHub:
+    """
+    Koji hub stand-in holding one channel of generated builders
+    """
+
+    def __init__(self, hosts=100, latency=0.0, seed=0, channel="synthetic"):
+        self.latency = latency
+        self.channel = {"id": 1, "name": channel}
+        self.calls = Counter()
+        self.round_trips = 0
+        self.lock = threading.Lock()
+        self.hosts = []
+        self.tasks = {}
+        self.builds = {}
+        self.logs = {}
+
+        rng = random.Random(seed)
+        task_id = 1000000
+        build_id = 1
+        for host_id in range(1, hosts + 1):
+            arches, cpus, ram_kb = rng.choice(BUILDER_KINDS)
+            # A few builders drift from their kind's configuration
+            if rng.random() < 0.05:
+                cpus //= 2
+            self.hosts.append(
+                {
+                    "id": host_id,
+                    "name": f"builder-{host_id:05d}.example.com",
+                    "enabled": True,
+                    "arches": arches,
+                    "description": (
+                        f"Updated: {datetime.date.today()}\n"
+                        f"vCPU Count: {cpus}\n"
+                        f"Total Memory: {ram_kb / 2**20:.3f} gb\n"
+                    ),
+                }
+            )
+            arch = arches.split(" ")[0]
+            host_tasks = []
+            for i in range(TASKS_PER_HOST):
+                task_id += 2
+                host_tasks.append({"id": task_id, "parent": task_id - 1})
+                if rng.random() >= SCRATCH_RATE:
+                    self.builds[task_id - 1] = {"build_id": build_id}
+                    path = f"vol/synthetic/packages/pkg/{build_id}/data/logs/{arch}/hw_info.log"
+                    self.logs[build_id] = [
+                        {"dir": arch, "name": "hw_info.log", "path": path},
+                        {"dir": arch, "name": "build.log", "path": path[:-11] + "build.log"},
+                    ]
+                    SyntheticDownloads.files[f"{TOPURL}/{path}"] = hw_info_log(
+                        arch, cpus, ram_kb
+                    )
+                    build_id += 1
+            # listTasks returns newest first
+            self.tasks[host_id] = list(reversed(host_tasks))
+
+    def round_trip(self, method):
+        with self.lock:
+            self.calls[method] += 1
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def answer(self, method, *args, **kwargs):
+        return getattr(self, f"do_{method}")(*args, **kwargs)
+
+    def __getattr__(self, method):
+        if not hasattr(type(self), f"do_{method}"):
+            raise AttributeError(method)
+
+        def call(*args, **kwargs):
+            self.round_trip(method)
+            return self.answer(method, *args, **kwargs)
+
+        return call
+
+    def multicall(self, strict=False, batch=None):
+        return SyntheticMultiCall(self)
+
+    def do_getChannel(self, name):
+        return dict(self.channel)
+
+    def do_listChannels(self):
+        return [dict(self.channel)]
+
+    def do_listHosts(self, channelID=None):
+        return [dict(host) for host in self.hosts]
+
+    def do_listTasks(self, opts, queryOpts):
+        offset = queryOpts.get("offset", 0)
+        return self.tasks.get(opts["host_id"], [])[offset : offset + queryOpts["limit"]]
+
+    def do_listBuilds(self, taskID=None):
+        build = self.builds.get(taskID)
+        return [dict(build)] if build != None else []
+
+    def do_getBuildLogs(self, build_id):
+        return self.logs.get(build_id, [])
+
+
+class SyntheticCall:
+    """
+    Result of a call made in a SyntheticMultiCall
+    """
+
+    def __init__(self, method, result):
+        self.method = method
+        self.result = result
+
+
+class SyntheticMultiCall:
+    """
+    Multicall on a SyntheticHub, counted as a single round trip
+    """
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _type, value, traceback):
+        if _type is None and len(self.pending) != 0:
+            self.hub.round_trip("multiCall")
+            with self.hub.lock:
+                for call in self.pending:
+                    self.hub.calls[f"multiCall.{call.method}"] += 1
+        return False
+
+    def __getattr__(self, method):
+        def call(*args, **kwargs):
+            result = SyntheticCall(method, self.hub.answer(method, *args, **kwargs))
+            self.pending.append(result)
+            return result
+
+        return call
+
+
+class SyntheticResponse:
+    """
+    Streamed response from SyntheticDownloads
+    """
+
+    def __init__(self, text):
+        self.text = text
+
+    def iter_lines(self, chunk_size=512):
+        for line in self.text.split("\n"):
+            yield line.encode()
+
+    def close(self):
+        pass
+
+
+class SyntheticDownloads:
+    """
+    Download server stand-in serving the hw_info.log files of every
+    SyntheticHub, used in place of LogSession
+    """
+
+    files = {}
+
+    def __init__(self, latency=0.0, **kwargs):
+        self.latency = latency
+        self.gets = 0
+        self.lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        with self.lock:
+            self.gets += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return SyntheticResponse(self.files[url])
+
+    def fetch(self, url, parse):
+        return parse(self.get(url).iter_lines())
+
+    def close(self):
+        pass
@@ -1,21 +1,427 @@
 import argparse
-import kojichannelvalidator.koji_channel_validator as cv
+import importlib
+import sys
+from kojichannelvalidator import defaults
+from kojichannelvalidator.cache import DEFAULT_TTL, RESULT_TTL, HwInfoCache, result_key
 
+# Module and function run by each command. They import koji and requests, so
+# they are only imported once the command line has been parsed.
+COMMANDS = {
+    "check": ("kojichannelvalidator.koji_channel_validator", "check"),
+    "serve": ("kojichannelvalidator.daemon", "serve"),
+    "merge": ("kojichannelvalidator.koji_channel_validator", "merge"),
+    "history": ("kojichannelvalidator.history", "history"),
+}
 
-def main():
+
+def parse_shard(value):
     """
-    Collect any command line arguments for the tool and launch the tool.
+    Parses a --shard value of the form i/N
+    """
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, got {value}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be from 0 to N-1, got {value}")
+    return index, count
+
+
+def parse_jobs(value):
+    """
+    Parses a -j/--jobs value, which must be a positive int
+    """
+    try:
+        jobs = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a number, got {value}")
+    if jobs < 1:
+        raise argparse.ArgumentTypeError(f"jobs must be at least 1, got {value}")
+    return jobs
+
+
+def parse_thresholds(path):
+    """
+    Loads the thresholds file given with --thresholds
+    """
+    from kojichannelvalidator.grouping import load_thresholds
+
+    try:
+        return load_thresholds(path)
+    except (OSError, ValueError) as err:
+        raise argparse.ArgumentTypeError(str(err))
+
+
+def add_thresholds_argument(parser):
+    """
+    Adds the option reading grouping tolerances and limits from a file to
+    parser
+    """
+    parser.add_argument(
+        "--thresholds",
+        type=parse_thresholds,
+        metavar="PATH",
+        help="JSON file of grouping tolerances and minimum and maximum CPU(s), Ram, Disk and Swap, for every channel or per channel",
+    )
+
+
+def add_hub_arguments(parser):
+    """
+    Adds the options choosing the koji hub to parser
+    """
+    parser.add_argument(
+        "--profile",
+        default=defaults.DEFAULT_PROFILE,
+        help=f"Koji profile to read the hub settings from (default: {defaults.DEFAULT_PROFILE})",
+    )
+    parser.add_argument("--server", help="Hub URL, overriding the profile's")
+    parser.add_argument(
+        "--topurl", help="Download server URL for build logs, overriding the profile's"
+    )
+
+
+def add_history_arguments(parser):
+    """
+    Adds the options recording each run in the history file to parser
+    """
+    parser.add_argument(
+        "--history",
+        action="store_true",
+        help='Record the hardware and configuration group of every host for "kcv history"',
+    )
+    parser.add_argument(
+        "--history-file",
+        metavar="PATH",
+        help="History file (default: history.sqlite under the XDG data directory)",
+    )
+
+
+def build_parser():
+    """
+    Returns the argument parser for "kcv check", which is also run when no
+    command is given
     """
-    parser = argparse.ArgumentParser()
+    parser = argparse.ArgumentParser(
+        prog="kcv [check]",
+        description="Validate that the hosts of koji channels have similar hardware",
+        epilog='Other commands: "kcv serve", "kcv merge" and "kcv history". Run them with --help for their options.',
+    )
     parser.add_argument(
         "-l", "--log", action="store_true", help="Produces logging info for the tool"
     )
+    channel_group = parser.add_mutually_exclusive_group(required=True)
+    channel_group.add_argument(
+        "-c", "--channel", help="Sets the channel name being validated"
+    )
+    channel_group.add_argument(
+        "-a",
+        "--all-channels",
+        action="store_true",
+        help="Validates every channel, probing each host only once",
+    )
+    add_hub_arguments(parser)
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=["text", "json", "ndjson"],
+        default="text",
+        help="Output format. ndjson streams a record per host as it is probed",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=parse_jobs,
+        default=1,
+        help="Number of hosts to probe concurrently (default: 1)",
+    )
+    parser.add_argument(
+        "-b",
+        "--batch",
+        action="store_true",
+        help="Collect task, build and log info for all hosts with koji multicalls",
+    )
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        action="store_true",
+        help="Only probe hosts whose newest buildArch task changed since the last incremental run",
+    )
+    parser.add_argument(
+        "-k",
+        "--samples",
+        type=int,
+        default=1,
+        metavar="K",
+        help="Read the hw_info logs of the last K builds of each host with batched multicalls and use their consensus (default: 1)",
+    )
+    parser.add_argument(
+        "-P",
+        "--processes",
+        type=int,
+        default=1,
+        help="Number of worker processes to probe hosts in, each with its own hub session (default: 1)",
+    )
     parser.add_argument(
-        "-c", "--channel", required=True, help="Sets the channel name being validated"
+        "--shard",
+        type=parse_shard,
+        metavar="i/N",
+        help='Only probe the hosts of shard i of N and write a JSON document for "kcv merge"',
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "-t",
+        "--tiered",
+        action="store_true",
+        help="Validate hosts from their hub description and only read hw_info.log for hosts whose description is missing, stale or inconsistent",
+    )
+    parser.add_argument(
+        "--description-max-age",
+        type=int,
+        default=defaults.DESCRIPTION_MAX_AGE,
+        metavar="DAYS",
+        help=f"Days before a host description is too old for --tiered (default: {defaults.DESCRIPTION_MAX_AGE})",
+    )
+    parser.add_argument(
+        "--scratch-limit",
+        type=int,
+        default=defaults.SCRATCH_SEARCH_MAX,
+        help=f"Most buildArch tasks searched per host for a non scratch build (default: {defaults.SCRATCH_SEARCH_MAX})",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Reuse hw_info results cached under the XDG cache directory",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=int,
+        default=DEFAULT_TTL,
+        help=f"Seconds before a cached host is probed again (default: {DEFAULT_TTL})",
+    )
+    parser.add_argument(
+        "--result-ttl",
+        type=int,
+        default=RESULT_TTL,
+        metavar="SECONDS",
+        help=f"With --cache, print the output of an identical check run within SECONDS without contacting koji, 0 to always run (default: {RESULT_TTL})",
+    )
+    parser.add_argument(
+        "--http-pool",
+        type=int,
+        default=defaults.HTTP_POOL_SIZE,
+        help=f"Connections kept open to the download server (default: {defaults.HTTP_POOL_SIZE})",
+    )
+    parser.add_argument(
+        "--http-timeout",
+        type=float,
+        default=defaults.HTTP_TIMEOUT,
+        help="Seconds to wait on the download server before giving up",
+    )
+    parser.add_argument(
+        "--http-retries",
+        type=int,
+        default=defaults.HTTP_RETRIES,
+        help=f"Retries for a failed hw_info.log download (default: {defaults.HTTP_RETRIES})",
+    )
+    parser.add_argument(
+        "--http-rate",
+        type=float,
+        metavar="RATE",
+        help="Most hw_info.log downloads started a second (default: no limit)",
+    )
+    parser.add_argument(
+        "--hub-rate",
+        type=float,
+        metavar="RATE",
+        help="Most hub calls made a second, a multicall counting as one (default: no limit)",
+    )
+    parser.add_argument(
+        "--hub-retries",
+        type=int,
+        default=defaults.RETRIES,
+        help=f"Retries for a hub call that fails because the hub is unavailable (default: {defaults.RETRIES})",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Print how long each hub call, download and phase took to stderr",
+    )
+    parser.add_argument(
+        "--timings-json",
+        metavar="PATH",
+        help="Write the timing summary to PATH as JSON",
+    )
+    add_thresholds_argument(parser)
+    add_history_arguments(parser)
+    return parser
+
+
+def build_serve_parser():
+    """
+    Returns the argument parser for "kcv serve", which runs the tool as a
+    daemon
+    """
+    parser = argparse.ArgumentParser(
+        prog="kcv serve",
+        description="Sweep channels on a schedule and serve the results as Prometheus metrics",
+    )
+    parser.add_argument(
+        "-l", "--log", action="store_true", help="Produces logging info for the tool"
+    )
+    channel_group = parser.add_mutually_exclusive_group(required=True)
+    channel_group.add_argument(
+        "-c",
+        "--channel",
+        action="append",
+        help="Channel name to sweep, may be given more than once",
+    )
+    channel_group.add_argument(
+        "-a", "--all-channels", action="store_true", help="Sweeps every channel"
+    )
+    add_hub_arguments(parser)
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=defaults.DEFAULT_INTERVAL,
+        help=f"Seconds between sweeps of each channel (default: {defaults.DEFAULT_INTERVAL})",
+    )
+    parser.add_argument(
+        "--bind", default="127.0.0.1", help="Address to serve metrics on (default: 127.0.0.1)"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=defaults.DEFAULT_PORT,
+        help=f"Port to serve metrics on (default: {defaults.DEFAULT_PORT})",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=parse_jobs,
+        default=1,
+        help="Number of hw_info.log downloads run concurrently (default: 1)",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Keep host snapshots in the cache file so they survive restarts",
+    )
+    add_thresholds_argument(parser)
+    add_history_arguments(parser)
+    return parser
+
+
+def build_merge_parser():
+    """
+    Returns the argument parser for "kcv merge", which merges the documents
+    written by the shards of a run split with --shard
+    """
+    parser = argparse.ArgumentParser(
+        prog="kcv merge",
+        description="Merge the JSON documents of every shard of a run and validate the channels",
+    )
+    parser.add_argument("files", nargs="+", help="Shard documents to merge")
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=["text", "json", "ndjson"],
+        default="text",
+        help="Output format",
+    )
+    add_thresholds_argument(parser)
+    add_history_arguments(parser)
+    return parser
+
+
+def build_history_parser():
+    """
+    Returns the argument parser for "kcv history", which reports hardware
+    drift from the history recorded by runs with --history
+    """
+    from kojichannelvalidator import history
+
+    parser = argparse.ArgumentParser(
+        prog="kcv history",
+        description="List the hosts whose CPU(s) or Ram changed, without querying koji",
+    )
+    parser.add_argument(
+        "-l", "--log", action="store_true", help="Produces logging info for the tool"
+    )
+    parser.add_argument(
+        "-d",
+        "--days",
+        type=float,
+        default=history.DEFAULT_DAYS,
+        help=f"Days to look back (default: {history.DEFAULT_DAYS})",
+    )
+    parser.add_argument("-c", "--channel", help="Only report hosts in this channel")
+    parser.add_argument("--host", type=int, metavar="ID", help="Only report this host id")
+    parser.add_argument(
+        "--ram-tolerance",
+        type=int,
+        default=history.RAM_DRIFT_TOLERANCE,
+        metavar="KB",
+        help=f"Smallest Ram change reported, in kB (default: {history.RAM_DRIFT_TOLERANCE})",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=["text", "json"],
+        default="text",
+        help="Output format",
+    )
+    parser.add_argument(
+        "--history-file",
+        metavar="PATH",
+        help="History file (default: history.sqlite under the XDG data directory)",
+    )
+    return parser
+
+
+PARSERS = {
+    "check": build_parser,
+    "serve": build_serve_parser,
+    "merge": build_merge_parser,
+    "history": build_history_parser,
+}
+
+
+def cached_check(args):
+    """
+    Prints the output of an identical check run within --result-ttl seconds,
+    if there is one in the cache, without importing koji or requests
+
+    returns the exit status of that check, or None if it was not cached
+    """
+    key = result_key(args)
+    if key == None:
+        return None
+    cache = HwInfoCache(ttl=args.cache_ttl)
+    result = cache.get_result(key, args.result_ttl)
+    cache.close()
+    if result == None:
+        return None
+    output, status = result
+    sys.stdout.write(output)
+    return status
+
+
+def main():
+    """
+    Collect any command line arguments for the tool and launch the tool.
+    """
+    argv = sys.argv[1:]
+    command = "check"
+    if len(argv) != 0 and argv[0] in PARSERS:
+        command = argv.pop(0)
+    args = PARSERS[command]().parse_args(argv)
+
+    if command == "check":
+        status = cached_check(args)
+        if status != None:
+            exit(status)
 
-    exit(cv.check(args))
+    module, function = COMMANDS[command]
+    exit(getattr(importlib.import_module(module), function)(args))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,261 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Hosts are re-probed once their cached build is older than this
+DEFAULT_TTL = 24 * 60 * 60
+# Output of a check is not reused by identical checks unless --result-ttl
+# is given
+RESULT_TTL = 0
+# check options that change its output, and so the result cache key
+RESULT_OPTIONS = (
+    "channel",
+    "all_channels",
+    "profile",
+    "server",
+    "topurl",
+    "format",
+    "tiered",
+    "description_max_age",
+    "samples",
+    "scratch_limit",
+)
+# Least recently used hw_info entries are evicted past this size
+DEFAULT_MAX_ENTRIES = 10000
+# Bumped when the tables change, older hw_info and snapshot tables are dropped
+SCHEMA_VERSION = 2
+# SQLite type of each HwInfo field read from hw_info.log, see parse_hw_log
+HW_COLUMNS = {
+    "cpus": "INTEGER",
+    "sockets": "INTEGER",
+    "threads_per_core": "INTEGER",
+    "model_name": "TEXT",
+    "ram_kb": "INTEGER",
+    "swap_kb": "INTEGER",
+    "disk": "TEXT",
+    "mount": "TEXT",
+}
+# Hardware fields stored for each hw_info.log and host snapshot
+HW_FIELDS = tuple(HW_COLUMNS)
+# Values saved for each host by incremental runs
+SNAPSHOT_FIELDS = ("last_task_id", "task_id", "parent_id", "build_id") + HW_FIELDS
+
+
+def result_key(args):
+    """
+    Returns the key the output of a check with the command line arguments
+    args is cached under, or None if its output is not cached. Only runs
+    using --cache with a --result-ttl are cached, and not runs that shard,
+    record history, print timings or log, since those must do the work.
+    """
+    if not args.cache or args.result_ttl <= 0:
+        return None
+    if args.shard != None or args.history or args.timings or args.timings_json != None:
+        return None
+    if args.log:
+        return None
+    options = {name: getattr(args, name) for name in RESULT_OPTIONS}
+    if args.thresholds != None:
+        options["thresholds"] = args.thresholds.settings
+    return json.dumps(options, sort_keys=True)
+
+
+def default_cache_path():
+    """
+    Returns the path of the cache file under the XDG cache directory
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_home, "kojichannelvalidator", "cache.sqlite")
+
+
+class HwInfoCache:
+    """
+    Persistent cache of parsed hw_info.log results. Maps (build_id, log dir)
+    to the hardware pulled from that log, and maps host_id to the last build
+    a hw_info.log was found for.
+
+    It also keeps the snapshots used by incremental runs, which record the
+    newest buildArch task seen for each host along with its hardware. The
+    snapshots do not expire, a host is re-probed when its newest task changes.
+
+    The output and exit status of recent checks are kept too, see result_key.
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path or default_cache_path()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # The cache is shared by the worker threads used to probe hosts
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        hw_columns = ", ".join(f"{field} {kind}" for field, kind in HW_COLUMNS.items())
+        with self.lock, self.conn:
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < SCHEMA_VERSION:
+                # Version 1 only kept CPU(s), Ram and Disk. The entries are
+                # dropped rather than kept without the other fields.
+                self.conn.execute("DROP TABLE IF EXISTS hw_info")
+                self.conn.execute("DROP TABLE IF EXISTS host_snapshot")
+                self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS hw_info ("
+                f"build_id INTEGER, log_dir TEXT, {hw_columns}, created REAL, "
+                "used REAL, PRIMARY KEY (build_id, log_dir))"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS host_build ("
+                "host_id INTEGER PRIMARY KEY, task_id INTEGER, parent_id INTEGER, "
+                "build_id INTEGER, log_dir TEXT, created REAL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS hw_info_used ON hw_info(used)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS host_snapshot ("
+                "host_id INTEGER PRIMARY KEY, last_task_id INTEGER, task_id INTEGER, "
+                f"parent_id INTEGER, build_id INTEGER, {hw_columns}, created REAL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS check_result ("
+                "key TEXT PRIMARY KEY, output TEXT, status INTEGER, created REAL)"
+            )
+        self.purge()
+
+    def close(self):
+        self.conn.close()
+
+    def purge(self):
+        """
+        Removes entries older than the ttl
+        """
+        cutoff = time.time() - self.ttl
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM hw_info WHERE created < ?", (cutoff,))
+            self.conn.execute("DELETE FROM host_build WHERE created < ?", (cutoff,))
+            self.conn.execute("DELETE FROM check_result WHERE created < ?", (cutoff,))
+
+    def get_hw_info(self, build_id, log_dir):
+        """
+        Returns the cached hardware for a build's hw_info.log as a dict of the
+        HwInfo fields in HW_FIELDS, or None if it is not cached
+        """
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                f"SELECT {', '.join(HW_FIELDS)} FROM hw_info "
+                "WHERE build_id = ? AND log_dir = ? AND created >= ?",
+                (build_id, log_dir, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE hw_info SET used = ? WHERE build_id = ? AND log_dir = ?",
+                (now, build_id, log_dir),
+            )
+        return dict(zip(HW_FIELDS, row))
+
+    def put_hw_info(self, build_id, log_dir, hw_info):
+        """
+        Stores the hardware pulled from a build's hw_info.log, a dict of the
+        HwInfo fields in HW_FIELDS, and evicts the least recently used
+        entries past max_entries
+        """
+        now = time.time()
+        values = (build_id, log_dir) + tuple(hw_info[field] for field in HW_FIELDS)
+        placeholders = ", ".join("?" * (len(values) + 2))
+        with self.lock, self.conn:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO hw_info VALUES ({placeholders})",
+                values + (now, now),
+            )
+            self.conn.execute(
+                "DELETE FROM hw_info WHERE rowid IN (SELECT rowid FROM hw_info "
+                "ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def get_host_build(self, host_id):
+        """
+        Returns the last good build cached for a host as a dict, or None if
+        there is no fresh entry
+        """
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT task_id, parent_id, build_id, log_dir FROM host_build "
+                "WHERE host_id = ? AND created >= ?",
+                (host_id, time.time() - self.ttl),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "task_id": row[0],
+            "parent_id": row[1],
+            "build_id": row[2],
+            "log_dir": row[3],
+        }
+
+    def put_host_build(self, host_id, task_id, parent_id, build_id, log_dir):
+        """
+        Stores the last good build for a host
+        """
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO host_build VALUES (?, ?, ?, ?, ?, ?)",
+                (host_id, task_id, parent_id, build_id, log_dir, time.time()),
+            )
+
+    def get_snapshot(self, host_id):
+        """
+        Returns the snapshot saved for a host as a dict, or None if there is
+        no snapshot
+        """
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                f"SELECT {', '.join(SNAPSHOT_FIELDS)} FROM host_snapshot "
+                "WHERE host_id = ?",
+                (host_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(SNAPSHOT_FIELDS, row))
+
+    def put_snapshot(self, host_id, snapshot):
+        """
+        Saves a host snapshot, a dict with the keys in SNAPSHOT_FIELDS
+        """
+        placeholders = ", ".join("?" * (len(SNAPSHOT_FIELDS) + 2))
+        with self.lock, self.conn:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO host_snapshot VALUES ({placeholders})",
+                (host_id,)
+                + tuple(snapshot[field] for field in SNAPSHOT_FIELDS)
+                + (time.time(),),
+            )
+
+    def get_result(self, key, ttl):
+        """
+        Returns the output and exit status of a check stored under key within
+        the last ttl seconds, or None if there is none
+        """
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT output, status FROM check_result WHERE key = ? AND created >= ?",
+                (key, time.time() - ttl),
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1]
+
+    def put_result(self, key, output, status):
+        """
+        Stores the output and exit status of a check under key
+        """
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO check_result VALUES (?, ?, ?, ?)",
+                (key, output, status, time.time()),
+            )
@@ -0,0 +1,268 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from kojichannelvalidator.cache import HwInfoCache
+from kojichannelvalidator.defaults import DEFAULT_INTERVAL, DEFAULT_PORT
+from kojichannelvalidator.history import HistoryStore
+from kojichannelvalidator.koji_channel_validator import (
+    Channel,
+    LogSession,
+    RunContext,
+    collect_channels,
+    probe_hosts_incremental,
+)
+from kojichannelvalidator.timing import TIMINGS
+
+
+class ChannelResult:
+    """
+    Outcome of the latest sweep of a channel
+    """
+
+    __slots__ = ("channel", "valid", "finished", "duration", "timings", "errors")
+
+    def __init__(self, channel, valid, finished, duration, timings, errors=0):
+        self.channel = channel
+        self.valid = valid
+        self.finished = finished
+        self.duration = duration
+        self.timings = timings
+        self.errors = errors
+
+
+def escape_label(value):
+    """
+    Escapes a Prometheus label value
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_metrics(results, errors):
+    """
+    Returns the latest sweep results in the Prometheus text exposition format.
+    results maps channel name to ChannelResult and errors maps channel name
+    to the number of failed sweeps.
+    """
+    metrics = {
+        "kcv_channel_valid": ("gauge", "1 if every host in the channel is valid"),
+        "kcv_channel_hosts": ("gauge", "Hosts in the channel"),
+        "kcv_channel_groups": ("gauge", "Configuration groups in the channel"),
+        "kcv_host_group": ("gauge", "Configuration group of each host, with its hardware"),
+        "kcv_sweep_duration_seconds": ("gauge", "Time the latest sweep took"),
+        "kcv_sweep_timestamp_seconds": ("gauge", "Unix time the latest sweep finished"),
+        "kcv_probe_seconds": ("gauge", "Latency of the hub calls and downloads in the latest sweep"),
+        "kcv_probe_count": ("gauge", "Hub calls and downloads made in the latest sweep"),
+        "kcv_sweep_errors_total": ("counter", "Sweeps that failed"),
+    }
+    samples = {name: [] for name in metrics}
+
+    for name, result in sorted(results.items()):
+        channel = result.channel
+        label = f'channel="{escape_label(name)}"'
+        samples["kcv_channel_valid"].append((label, int(result.valid)))
+        samples["kcv_channel_hosts"].append((label, len(channel.host_list)))
+        samples["kcv_channel_groups"].append((label, len(channel.config_groups)))
+        samples["kcv_sweep_duration_seconds"].append((label, result.duration))
+        samples["kcv_sweep_timestamp_seconds"].append((label, result.finished))
+        for index, group in enumerate(channel.config_groups):
+            for host in group:
+                host_label = (
+                    f'{label},host="{escape_label(host.name)}",host_id="{host.id}",'
+                    f'group="{index + 1}",cpus="{host.hw.cpus}",ram_kb="{host.hw.ram_kb}"'
+                )
+                samples["kcv_host_group"].append((host_label, index + 1))
+        for phase, row in result.timings.items():
+            phase_label = f'{label},phase="{escape_label(phase)}"'
+            samples["kcv_probe_count"].append((phase_label, row["count"]))
+            for stat in ("p50", "p95", "max"):
+                samples["kcv_probe_seconds"].append(
+                    (f'{phase_label},stat="{stat}"', row[stat])
+                )
+    for name, count in sorted(errors.items()):
+        samples["kcv_sweep_errors_total"].append(
+            (f'channel="{escape_label(name)}"', count)
+        )
+
+    lines = []
+    for name, (metric_type, help_text) in metrics.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in samples[name]:
+            lines.append(f"{name}{{{labels}}} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def login(session, opts):
+    """
+    Logs session in using the authentication set in the koji profile opts.
+    The validator only reads from the hub, so no authtype means anonymous.
+    """
+    authtype = opts.get("authtype")
+    if authtype == "ssl":
+        session.ssl_login(
+            os.path.expanduser(opts["cert"]), None, os.path.expanduser(opts["serverca"])
+        )
+    elif authtype in ("kerberos", "gssapi"):
+        session.gssapi_login(
+            principal=opts.get("principal"), keytab=opts.get("keytab")
+        )
+
+
+class Sweeper:
+    """
+    Sweeps channels on a schedule with one long lived hub session, keeping
+    the latest result for each channel. Host results are kept between sweeps
+    so only hosts with a new build are probed again. Each sweep is recorded
+    in history if one is given, and channels are grouped and validated with
+    the thresholds of a ThresholdConfig if one is given.
+    """
+
+    def __init__(self, ctx, channel_names, interval, history=None, thresholds=None):
+        self.ctx = ctx
+        self.history = history
+        self.thresholds = thresholds
+        self.channel_names = list(channel_names)
+        self.interval = interval
+        self.results = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def sweep(self, channel_name):
+        """
+        Validates one channel and stores its result
+        """
+        TIMINGS.reset()
+        start = time.monotonic()
+        channel_info = self.ctx.session.getChannel(channel_name)
+        channel = Channel(channel_info["name"], channel_info["id"])
+        if self.thresholds != None:
+            channel.set_thresholds(self.thresholds.for_channel(channel.name))
+        channel.collect_hosts(self.ctx)
+        probe_hosts_incremental(channel.host_list, self.ctx)
+        channel.config_check()
+        valid = channel.is_valid()
+
+        result = ChannelResult(
+            channel, valid, time.time(), time.monotonic() - start, TIMINGS.summary()
+        )
+        with self.lock:
+            self.results[channel_name] = result
+        if self.history != None:
+            run_id, run_ts = self.history.start_run(result.finished)
+            self.history.record_channel(run_id, run_ts, channel, valid)
+        logging.info(
+            f"Swept {channel_name} in {result.duration:.1f}s valid: {valid}"
+        )
+
+    def schedule(self, now):
+        """
+        Returns the first sweep time of each channel. Sweeps are spread
+        evenly over the interval so the hub sees a steady load.
+        """
+        step = self.interval / max(len(self.channel_names), 1)
+        return [
+            (now + index * step, channel_name)
+            for index, channel_name in enumerate(self.channel_names)
+        ]
+
+    def run(self):
+        """
+        Sweeps channels until stop() is called
+        """
+        queue = self.schedule(time.monotonic())
+        heapq.heapify(queue)
+        while not self.stopped.is_set() and len(queue) != 0:
+            due, channel_name = heapq.heappop(queue)
+            if self.stopped.wait(max(due - time.monotonic(), 0)):
+                break
+            try:
+                self.sweep(channel_name)
+            except Exception:
+                logging.exception(f"Sweep of {channel_name} failed")
+                with self.lock:
+                    self.errors[channel_name] = self.errors.get(channel_name, 0) + 1
+            heapq.heappush(queue, (due + self.interval, channel_name))
+
+    def stop(self):
+        self.stopped.set()
+
+    def metrics(self):
+        with self.lock:
+            return render_metrics(dict(self.results), dict(self.errors))
+
+
+def make_handler(sweeper):
+    """
+    Returns a request handler class serving the sweeper's metrics
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = sweeper.metrics().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug(format, *args)
+
+    return MetricsHandler
+
+
+def serve(args):
+    """
+    Runs the validator as a daemon, sweeping channels on a schedule and
+    serving the latest results as Prometheus metrics
+    """
+    if args.log:
+        logging.basicConfig(
+            format="%(asctime)s %(levelname)-8s %(message)s",
+            level=logging.INFO,
+            datefmt="%Y-%m-%d %H:%M:%S",
+        )
+    TIMINGS.enabled = True
+
+    ctx = RunContext(
+        profile=args.profile,
+        server=args.server,
+        topurl=args.topurl,
+        http=LogSession(pool_size=max(args.jobs, 1)),
+        cache=HwInfoCache() if args.cache else HwInfoCache(path=":memory:"),
+        jobs=args.jobs,
+    )
+    login(ctx.session, ctx.opts)
+
+    if args.all_channels:
+        channel_names = [channel.name for channel in collect_channels(ctx)]
+    else:
+        channel_names = args.channel
+
+    history = HistoryStore(args.history_file) if args.history else None
+    sweeper = Sweeper(ctx, channel_names, args.interval, history, args.thresholds)
+
+    server = ThreadingHTTPServer((args.bind, args.port), make_handler(sweeper))
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    logging.info(f"Serving metrics on http://{args.bind}:{args.port}/metrics")
+
+    try:
+        sweeper.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sweeper.stop()
+        server.shutdown()
+        ctx.close()
+        if history != None:
+            history.close()
+
+    return 0
@@ -0,0 +1,26 @@
+"""
+Defaults shown in the command line help. They are kept apart from the
+modules that use them, which import koji and requests, so that parsing the
+command line does not have to import those.
+"""
+
+# Koji profile used unless another is given with --profile
+DEFAULT_PROFILE = "brew"
+# Number of recent buildArch tasks searched for a non scratch build by the
+# batched collection path, and the default most searched per host otherwise
+SCRATCH_SEARCH_LIMIT = 10
+SCRATCH_SEARCH_MAX = 64
+# Days after which a host description is too old to validate a host with
+DESCRIPTION_MAX_AGE = 90
+# Defaults for hw_info.log downloads. HTTP_TIMEOUT is (connect, read) seconds
+HTTP_POOL_SIZE = 10
+HTTP_TIMEOUT = (10, 60)
+HTTP_RETRIES = 3
+# Defaults for retrying failed calls. Delays are in seconds
+RETRIES = 3
+BACKOFF = 0.5
+MAX_BACKOFF = 30
+# Seconds between sweeps of each channel and port metrics are served on by
+# the daemon
+DEFAULT_INTERVAL = 60 * 60
+DEFAULT_PORT = 9464
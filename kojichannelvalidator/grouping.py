@@ -0,0 +1,493 @@
+import bisect
+import json
+import math
+
+# NumPy is optional and slow to import, so it is only imported by
+# load_numpy once hosts are grouped. None if it is not installed.
+NOT_LOADED = object()
+numpy = NOT_LOADED
+
+# Metrics hosts are grouped and validated on, in the order they are packed
+METRICS = ("cpus", "ram_kb", "disk_kb", "swap_kb")
+# Names of the metrics in log messages
+METRIC_LABELS = {"cpus": "CPU(s)", "ram_kb": "Ram", "disk_kb": "Disk", "swap_kb": "Swap"}
+# 4gb tolerance for ram similarity, Ram is in kB
+RAM_TOLERANCE = 4000000
+# Grouping tolerance of each metric. Metrics with a tolerance of None are
+# not compared, and a CPU(s) tolerance of 0 means counts must match exactly
+DEFAULT_TOLERANCES = {"cpus": 0, "ram_kb": RAM_TOLERANCE, "disk_kb": None, "swap_kb": None}
+# Hosts missing one of these metrics are only grouped with hosts also
+# missing it. A host missing any other metric is similar to every host on it.
+STRICT_METRICS = ("cpus",)
+# kB in each size unit used by df -h
+SIZE_UNITS = {"K": 1, "M": 1024, "G": 1024**2, "T": 1024**3, "P": 1024**4}
+# Sections of a thresholds file, as a channel section or the top level
+THRESHOLD_SECTIONS = ("tolerance", "min", "max")
+
+
+def load_numpy():
+    """
+    Imports NumPy the first time it is needed
+
+    returns the numpy module, or None if it is not installed
+    """
+    global numpy
+    if numpy is NOT_LOADED:
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        numpy = module
+    return numpy
+
+
+def size_kb(size):
+    """
+    Converts a df -h size such as "198G" to kB. Returns None if size is not
+    such a size.
+    """
+    if size == None or len(size) < 2 or size[-1] not in SIZE_UNITS:
+        return None
+    try:
+        return float(size[:-1]) * SIZE_UNITS[size[-1]]
+    except ValueError:
+        return None
+
+
+def metric_values(hw):
+    """
+    Returns the METRICS of a HwInfo as a tuple, with None for unknown values
+    """
+    return (hw.cpus, hw.ram_kb, size_kb(hw.disk), hw.swap_kb)
+
+
+class Thresholds:
+    """
+    Grouping tolerance of each metric, see DEFAULT_TOLERANCES, and the
+    minimum and maximum value of each metric allowed for the hosts of a
+    channel
+    """
+
+    __slots__ = ("tolerance", "minimum", "maximum")
+
+    def __init__(self, tolerance=None, minimum=None, maximum=None):
+        self.tolerance = dict(DEFAULT_TOLERANCES)
+        self.tolerance.update(tolerance or {})
+        self.minimum = dict(minimum or {})
+        self.maximum = dict(maximum or {})
+
+
+class ThresholdConfig:
+    """
+    Thresholds read from a JSON file. The top level "tolerance", "min" and
+    "max" objects apply to every channel, and the same objects under
+    "channels" and a channel's name override them for that channel:
+
+        {
+          "tolerance": {"ram_kb": 2000000, "disk_kb": 10485760},
+          "min": {"cpus": 8},
+          "channels": {"createrepo": {"min": {"ram_kb": 16000000}}}
+        }
+    """
+
+    def __init__(self, settings=None):
+        self.settings = settings or {}
+
+    def for_channel(self, name):
+        """
+        Returns the Thresholds for the channel called name
+        """
+        merged = {section: {} for section in THRESHOLD_SECTIONS}
+        channel = self.settings.get("channels", {}).get(name, {})
+        for settings in (self.settings, channel):
+            for section in THRESHOLD_SECTIONS:
+                merged[section].update(settings.get(section, {}))
+        return Thresholds(merged["tolerance"], merged["min"], merged["max"])
+
+
+def check_threshold_section(settings, where):
+    """
+    Raises ValueError if a section of a thresholds file has an unknown key,
+    an unknown metric or a value that is not a number
+    """
+    if not isinstance(settings, dict):
+        raise ValueError(f"{where} must be an object")
+    for section, values in settings.items():
+        if section not in THRESHOLD_SECTIONS:
+            raise ValueError(f"unknown key {section} in {where}")
+        if not isinstance(values, dict):
+            raise ValueError(f"{section} in {where} must be an object")
+        for metric, value in values.items():
+            if metric not in METRICS:
+                raise ValueError(
+                    f"unknown metric {metric} in {where}, expected one of {', '.join(METRICS)}"
+                )
+            allowed_none = section == "tolerance"
+            if isinstance(value, bool) or not (
+                isinstance(value, (int, float)) or (value == None and allowed_none)
+            ):
+                raise ValueError(f"{section} {metric} in {where} must be a number")
+
+
+def load_thresholds(path):
+    """
+    Reads a thresholds file, see ThresholdConfig. Raises ValueError if the
+    file is not valid.
+
+    returns a ThresholdConfig
+    """
+    with open(path) as fp:
+        try:
+            settings = json.load(fp)
+        except json.JSONDecodeError as err:
+            raise ValueError(f"{path} is not valid JSON: {err}")
+    if not isinstance(settings, dict):
+        raise ValueError(f"{path} must hold a JSON object")
+
+    channels = settings.get("channels", {})
+    if not isinstance(channels, dict):
+        raise ValueError(f"channels in {path} must be an object")
+    check_threshold_section(
+        {key: value for key, value in settings.items() if key != "channels"}, path
+    )
+    for name, channel in channels.items():
+        check_threshold_section(channel, f"channel {name} of {path}")
+    return ThresholdConfig(settings)
+
+
+def similar(seed, values, tolerance):
+    """
+    Returns True if the metric_values of a host are within tolerance of the
+    metric_values of a group's first host
+    """
+    for index, metric in enumerate(METRICS):
+        tol = tolerance[metric]
+        if tol == None:
+            continue
+        a, b = seed[index], values[index]
+        if a == None or b == None:
+            if metric in STRICT_METRICS and (a == None) != (b == None):
+                return False
+        elif abs(a - b) > tol:
+            return False
+    return True
+
+
+def group_hosts(hosts, ram_tol=RAM_TOLERANCE):
+    """
+    Groups hosts with similar configurations, giving the same groups as
+    comparing every host against every later ungrouped host with
+    compare_hosts. Hosts are bucketed by CPU count and each bucket is sorted
+    by Ram, so the hosts within ram_tol of a group's first host are found
+    with a binary search instead of a pairwise scan.
+
+    returns a list of host groupings ordered by each group's first host
+    """
+    buckets = {}
+    for index, host in enumerate(hosts):
+        buckets.setdefault(host.hw.cpus, []).append(index)
+
+    index_groups = []
+    for members in buckets.values():
+        index_groups.extend(group_bucket(hosts, members, ram_tol))
+    index_groups.sort(key=lambda group: group[0])
+
+    return [[hosts[index] for index in group] for group in index_groups]
+
+
+class HostGrouper:
+    """
+    Groups hosts one at a time as their hardware becomes known. Adding hosts
+    in host_list order gives the same groups as cluster_hosts, since a host
+    only ever joins the first group whose first host it is similar to.
+    """
+
+    def __init__(self, tolerance=None):
+        self.tolerance = dict(DEFAULT_TOLERANCES)
+        self.tolerance.update(tolerance or {})
+        self.groups = []
+        # Groups of each CPU count, with their first host's metric values,
+        # in the order they were started. All groups share one bucket
+        # unless CPU(s) must match exactly.
+        self.buckets = {}
+
+    def add(self, host):
+        """
+        Adds host to the first similar group, or starts a new group
+
+        returns the group the host was added to
+        """
+        values = metric_values(host.hw)
+        key = values[0] if self.tolerance["cpus"] == 0 else None
+        bucket = self.buckets.setdefault(key, [])
+        for seed, group in bucket:
+            if similar(seed, values, self.tolerance):
+                group.append(host)
+                return group
+        group = [host]
+        bucket.append((values, group))
+        self.groups.append(group)
+        return group
+
+
+class OrderedHostGrouper:
+    """
+    Groups the hosts of a list with a HostGrouper while they are probed, in
+    whatever order the probe finishes them. Hosts are held as pending while
+    they are being probed, and a host is only added once every host before
+    it in the list has been, so the groups do not depend on the order hosts
+    are probed in. hosts may still be growing as hosts are listed.
+    """
+
+    def __init__(self, hosts, tolerance=None):
+        self.hosts = hosts
+        self.grouper = HostGrouper(tolerance)
+        self.pending = set()
+        # Index in hosts of the next host to add
+        self.next = 0
+
+    @property
+    def groups(self):
+        return self.grouper.groups
+
+    def hold(self, hosts):
+        """
+        Generator yielding hosts, each marked as pending until ready is
+        called for it
+        """
+        for host in hosts:
+            self.pending.add(host.id)
+            yield host
+
+    def ready(self, host):
+        """
+        Marks host as probed and adds every host that is no longer waiting
+        on a pending host before it
+        """
+        self.pending.discard(host.id)
+        self.add_ready()
+
+    def add_ready(self):
+        while self.next < len(self.hosts) and self.hosts[self.next].id not in self.pending:
+            self.grouper.add(self.hosts[self.next])
+            self.next += 1
+
+    def finish(self):
+        """
+        Adds the remaining hosts, including any the probe never reported
+
+        returns the groups
+        """
+        self.pending.clear()
+        self.add_ready()
+        return self.groups
+
+
+def cpu_buckets(rows, tolerance):
+    """
+    Splits row indexes into buckets of one CPU count when counts must match
+    exactly, or a single bucket otherwise
+
+    returns a list of buckets, each a list of row indexes in order
+    """
+    if tolerance["cpus"] != 0:
+        return [list(range(len(rows)))]
+    buckets = {}
+    for index, row in enumerate(rows):
+        buckets.setdefault(row[0], []).append(index)
+    return list(buckets.values())
+
+
+def cluster_rows(rows, tolerance):
+    """
+    Groups rows of metric_values in pure Python. Each group is started by
+    the first ungrouped row and takes every later ungrouped row similar to
+    it, which gives the same groups as adding the rows to a HostGrouper.
+
+    returns a list of groups, each a list of row indexes
+    """
+    groups = []
+    for bucket in cpu_buckets(rows, tolerance):
+        remaining = bucket
+        while len(remaining) != 0:
+            seed = rows[remaining[0]]
+            group = []
+            rest = []
+            for index in remaining:
+                if similar(seed, rows[index], tolerance):
+                    group.append(index)
+                else:
+                    rest.append(index)
+            groups.append(group)
+            remaining = rest
+    return groups
+
+
+def cluster_arrays(rows, tolerance):
+    """
+    Groups rows of metric_values like cluster_rows, with the metrics packed
+    into a NumPy array so the hosts similar to each group's first host are
+    found with one vectorized comparison per metric
+
+    returns a list of groups, each a list of row indexes
+    """
+    # None becomes NaN, which compares False with everything
+    values = numpy.array(rows, dtype=float).reshape(len(rows), len(METRICS))
+    compared = [
+        (column, tolerance[metric], metric in STRICT_METRICS)
+        for column, metric in enumerate(METRICS)
+        if tolerance[metric] != None
+    ]
+    if tolerance["cpus"] == 0:
+        # A stable sort keeps each bucket's rows in order
+        cpus = numpy.nan_to_num(values[:, 0], nan=-1.0)
+        order = numpy.argsort(cpus, kind="stable")
+        buckets = numpy.split(order, numpy.flatnonzero(numpy.diff(cpus[order])) + 1)
+    else:
+        buckets = [numpy.arange(len(rows))]
+
+    groups = []
+    for remaining in buckets:
+        while remaining.size != 0:
+            seed = values[remaining[0]]
+            in_group = numpy.ones(remaining.size, dtype=bool)
+            for column, tol, strict in compared:
+                column_values = values[remaining, column]
+                unknown = numpy.isnan(column_values)
+                if math.isnan(seed[column]):
+                    if strict:
+                        in_group &= unknown
+                    continue
+                close = numpy.abs(column_values - seed[column]) <= tol
+                if not strict:
+                    close |= unknown
+                in_group &= close
+            groups.append(remaining[in_group].tolist())
+            remaining = remaining[~in_group]
+    return groups
+
+
+def cluster_hosts(hosts, tolerance=None):
+    """
+    Groups hosts whose metrics are all within tolerance of the first host of
+    a group, see DEFAULT_TOLERANCES. The metrics are compared with NumPy if
+    it is installed. Without it, the default tolerances are handled by
+    group_hosts and others by cluster_rows.
+
+    returns a list of host groupings ordered by each group's first host
+    """
+    merged = dict(DEFAULT_TOLERANCES)
+    merged.update(tolerance or {})
+    load_numpy()
+    if numpy == None and merged == DEFAULT_TOLERANCES:
+        return group_hosts(hosts, merged["ram_kb"])
+
+    rows = [metric_values(host.hw) for host in hosts]
+    if len(rows) == 0:
+        return []
+    if numpy != None:
+        index_groups = cluster_arrays(rows, merged)
+    else:
+        index_groups = cluster_rows(rows, merged)
+    index_groups.sort(key=lambda group: group[0])
+    return [[hosts[index] for index in group] for group in index_groups]
+
+
+def check_limits(hosts, minimum, maximum):
+    """
+    Checks the metrics of every host against the minimum and maximum value
+    of each metric at once. Unknown values are not checked.
+
+    returns a (host, metric, value, bound, limit) tuple for each value
+    outside its limits, where bound is "minimum" or "maximum", in host order
+    """
+    rows = [metric_values(host.hw) for host in hosts]
+    if len(rows) == 0:
+        return []
+    low = [minimum.get(metric, -math.inf) for metric in METRICS]
+    high = [maximum.get(metric, math.inf) for metric in METRICS]
+
+    if load_numpy() != None:
+        values = numpy.array(rows, dtype=float).reshape(len(rows), len(METRICS))
+        below = values < numpy.array(low)
+        outside = numpy.argwhere(below | (values > numpy.array(high)))
+        failed = [(int(row), int(column), bool(below[row, column])) for row, column in outside]
+    else:
+        failed = [
+            (row, column, value < low[column])
+            for row, values in enumerate(rows)
+            for column, value in enumerate(values)
+            if value != None and not low[column] <= value <= high[column]
+        ]
+
+    return [
+        (
+            hosts[row],
+            METRICS[column],
+            rows[row][column],
+            "minimum" if is_below else "maximum",
+            low[column] if is_below else high[column],
+        )
+        for row, column, is_below in failed
+    ]
+
+
+def group_bucket(hosts, members, ram_tol):
+    """
+    Groups the hosts at the indexes in members, which all share a CPU count.
+
+    returns a list of groups, each a sorted list of host indexes
+    """
+    rams = {}
+    for index in members:
+        if hosts[index].hw.ram_kb != None:
+            rams[index] = hosts[index].hw.ram_kb
+
+    # A host without Ram is similar to every host in the bucket, so it joins
+    # the bucket's first group. If it is the first host it takes the bucket.
+    first = members[0]
+    if first not in rams:
+        return [list(members)]
+    unknown = [index for index in members if index not in rams]
+
+    by_ram = sorted(rams, key=lambda index: (rams[index], index))
+    ram_keys = [rams[index] for index in by_ram]
+    position = {index: pos for pos, index in enumerate(by_ram)}
+    # next_free[pos] leads to the first ungrouped position at or after pos
+    next_free = list(range(len(by_ram) + 1))
+
+    def find_free(pos):
+        root = pos
+        while next_free[root] != root:
+            root = next_free[root]
+        while next_free[pos] != root:
+            next_free[pos], pos = root, next_free[pos]
+        return root
+
+    groups = []
+    grouped = set()
+    for seed in members:
+        if seed in grouped:
+            continue
+        group = [seed]
+        grouped.add(seed)
+        next_free[position[seed]] = position[seed] + 1
+
+        # Every host before the seed is already grouped, so any ungrouped
+        # host in the window comes after the seed like in the pairwise scan
+        low = bisect.bisect_left(ram_keys, rams[seed] - ram_tol)
+        high = bisect.bisect_right(ram_keys, rams[seed] + ram_tol)
+        pos = find_free(low)
+        while pos < high:
+            group.append(by_ram[pos])
+            grouped.add(by_ram[pos])
+            next_free[pos] = pos + 1
+            pos = find_free(pos + 1)
+
+        if seed == first:
+            group.extend(unknown)
+            grouped.update(unknown)
+        group.sort()
+        groups.append(group)
+
+    return groups
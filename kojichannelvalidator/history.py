@@ -0,0 +1,204 @@
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+# Ram changes smaller than this, in kB, are not reported as drift
+RAM_DRIFT_TOLERANCE = 1024 * 1024
+# Default number of days "kcv history" looks back
+DEFAULT_DAYS = 30
+
+
+def default_history_path():
+    """
+    Returns the path of the history file under the XDG data directory
+    """
+    data_home = os.environ.get("XDG_DATA_HOME") or os.path.join(
+        os.path.expanduser("~"), ".local", "share"
+    )
+    return os.path.join(data_home, "kojichannelvalidator", "history.sqlite")
+
+
+class HistoryStore:
+    """
+    Append-only record of the hardware and configuration group of every
+    host in every validated channel, one entry per run. Entries are indexed
+    by (host_id, ts) and (channel, ts), so how hosts drifted over a time
+    range is answered from the store without asking koji about old builds.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_history_path()
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                "run_id INTEGER PRIMARY KEY, ts REAL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS host_hw ("
+                "run_id INTEGER, ts REAL, channel TEXT, grp INTEGER, valid INTEGER, "
+                "host_id INTEGER, host_name TEXT, build_id INTEGER, cpus INTEGER, "
+                "ram_kb INTEGER, disk TEXT, kernel TEXT, os TEXT)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS host_hw_host ON host_hw(host_id, ts)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS host_hw_channel ON host_hw(channel, ts)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS host_hw_ts ON host_hw(ts)")
+
+    def close(self):
+        self.conn.close()
+
+    def start_run(self, ts=None):
+        """
+        Records the start of a run. returns the run id and its timestamp
+        """
+        ts = ts if ts != None else time.time()
+        with self.lock, self.conn:
+            run_id = self.conn.execute(
+                "INSERT INTO runs (ts) VALUES (?)", (ts,)
+            ).lastrowid
+        return run_id, ts
+
+    def record_channel(self, run_id, ts, channel, valid):
+        """
+        Records the hardware and configuration group of every host in a
+        grouped and validated channel
+        """
+        rows = []
+        for index, group in enumerate(channel.config_groups):
+            for host in group:
+                task = host.task_list[0] if len(host.task_list) != 0 else None
+                rows.append(
+                    (
+                        run_id,
+                        ts,
+                        channel.name,
+                        index + 1,
+                        int(valid),
+                        host.id,
+                        host.name,
+                        task.build_id if task != None else None,
+                        host.hw.cpus,
+                        host.hw.ram_kb,
+                        host.hw.disk,
+                        host.hw.kernel,
+                        host.hw.os,
+                    )
+                )
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO host_hw VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def changes(
+        self, since, channel=None, host_id=None, ram_tol=RAM_DRIFT_TOLERANCE
+    ):
+        """
+        Returns the CPU(s) and Ram changes recorded since the time since,
+        oldest first. Each change is a dict of when it was seen, the channel
+        and host, and the CPU(s) and Ram before and after. Entries are only
+        compared with the previous entry for the same host in the same
+        channel, which is found through the (host_id, ts) index. Entries
+        without CPU(s) or Ram, recorded when a probe failed, are skipped on
+        both sides, so a failed probe is not reported as drift.
+        """
+        # The Ram tolerance comes first in the query, then the filters. The
+        # unary + keeps the previous entry lookup on the (host_id, ts) index
+        where = ["h.ts >= ?", "h.cpus IS NOT NULL", "h.ram_kb IS NOT NULL"]
+        params = [ram_tol, since]
+        if channel != None:
+            where.append("h.channel = ?")
+            params.append(channel)
+        if host_id != None:
+            where.append("h.host_id = ?")
+            params.append(host_id)
+
+        query = (
+            "SELECT h.ts, h.channel, h.host_id, h.host_name, "
+            "p.cpus, h.cpus, p.ram_kb, h.ram_kb, p.build_id, h.build_id "
+            "FROM host_hw h JOIN host_hw p ON p.rowid = ("
+            "SELECT rowid FROM host_hw WHERE host_id = h.host_id "
+            "AND +channel = h.channel AND ts < h.ts "
+            "AND cpus IS NOT NULL AND ram_kb IS NOT NULL ORDER BY ts DESC LIMIT 1) "
+            "WHERE (h.cpus != p.cpus OR abs(h.ram_kb - p.ram_kb) > ?) AND "
+            + " AND ".join(where)
+            + " ORDER BY h.ts, h.channel, h.host_id"
+        )
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+
+        keys = (
+            "ts",
+            "channel",
+            "host_id",
+            "host_name",
+            "cpus_before",
+            "cpus",
+            "ram_kb_before",
+            "ram_kb",
+            "build_id_before",
+            "build_id",
+        )
+        return [dict(zip(keys, row)) for row in rows]
+
+
+def format_change(change):
+    """
+    Returns a line describing a change returned by HistoryStore.changes
+    """
+    seen = datetime.datetime.fromtimestamp(change["ts"]).strftime("%Y-%m-%d %H:%M")
+    parts = []
+    if change["cpus"] != change["cpus_before"]:
+        parts.append(f"CPU(s) {change['cpus_before']} -> {change['cpus']}")
+    if change["ram_kb"] != change["ram_kb_before"]:
+        parts.append(f"Ram {change['ram_kb_before']} -> {change['ram_kb']} kB")
+    return (
+        f"{seen} {change['channel']} {change['host_name']} ({change['host_id']}): "
+        + ", ".join(parts)
+    )
+
+
+def history(args):
+    """
+    Prints the hosts whose CPU(s) or Ram changed in the last args.days days,
+    from the history recorded by runs with --history. Koji is not queried.
+    returns 1 if any host changed, 0 otherwise
+    """
+    if args.log:
+        logging.basicConfig(
+            format="%(asctime)s %(levelname)-8s %(message)s",
+            level=logging.INFO,
+            datefmt="%Y-%m-%d %H:%M:%S",
+        )
+
+    store = HistoryStore(args.history_file)
+    since = time.time() - args.days * 24 * 60 * 60
+    changes = store.changes(
+        since, channel=args.channel, host_id=args.host, ram_tol=args.ram_tolerance
+    )
+    store.close()
+    logging.info(f"{len(changes)} changes in the last {args.days} days")
+
+    if args.format == "json":
+        json.dump(changes, sys.stdout, indent=2)
+        print()
+    else:
+        for change in changes:
+            print(format_change(change))
+
+    if len(changes) != 0:
+        return 1
+
+    return 0
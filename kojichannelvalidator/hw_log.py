@@ -0,0 +1,98 @@
+import re
+
+# "key: value" lines from the CPU info section that are kept, by field name
+CPU_FIELDS = {
+    "CPU(s)": "cpus",
+    "Socket(s)": "sockets",
+    "Thread(s) per core": "threads_per_core",
+    "Model name": "model_name",
+}
+INT_FIELDS = ("cpus", "sockets", "threads_per_core")
+
+MEMORY_RE = re.compile(r"^(Mem|Swap):\s+(\d+)")
+SECTION_RE = re.compile(r"^'?(CPU info|Memory|Storage):\s*$")
+
+
+def empty_hw_log():
+    """
+    Returns the fields parse_hw_log fills in, all set to None
+    """
+    return {
+        "cpus": None,
+        "sockets": None,
+        "threads_per_core": None,
+        "model_name": None,
+        "ram_kb": None,
+        "swap_kb": None,
+        "disk": None,
+        "mount": None,
+    }
+
+
+def iter_text_lines(log):
+    """
+    Yields str lines from a hw_info.log given as str, bytes or an iterable of
+    str or bytes lines, such as requests' Response.iter_lines()
+    """
+    if isinstance(log, bytes):
+        log = log.decode("utf-8", "replace")
+    if isinstance(log, str):
+        log = log.split("\n")
+    for line in log:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", "replace")
+        yield line
+
+
+def parse_hw_log(log):
+    """
+    Parses the hardware information out of a mock hw_info.log in one pass.
+    The log is made of CPU info (lscpu), Memory (free) and Storage (df)
+    sections. Reading stops at the end of the Storage section, so a stream
+    given as log is not consumed past it.
+
+    returns a dict with the fields from empty_hw_log(). Ram and swap are in
+    kB, disk is the size of the last filesystem listed and mount its mount
+    point.
+    """
+    hw_log = empty_hw_log()
+    section = None
+
+    for line in iter_text_lines(log):
+        if line.strip() == "":
+            # Storage is the last section, nothing after it needs to be read
+            if section == "Storage" and hw_log["disk"] != None:
+                break
+            continue
+
+        section_match = SECTION_RE.match(line)
+        if section_match:
+            section = section_match.group(1)
+            continue
+
+        if line[0] == "/":
+            # Filesystem Size Used Avail Use% Mounted on
+            columns = line.split(None, 5)
+            if len(columns) > 1:
+                hw_log["disk"] = columns[1]
+                hw_log["mount"] = columns[5] if len(columns) == 6 else None
+            continue
+
+        memory_match = MEMORY_RE.match(line)
+        if memory_match:
+            key = "ram_kb" if memory_match.group(1) == "Mem" else "swap_kb"
+            hw_log[key] = int(memory_match.group(2))
+            continue
+
+        if section == "Memory" or section == "Storage":
+            continue
+
+        key, colon, value = line.partition(":")
+        if colon and key in CPU_FIELDS:
+            field = CPU_FIELDS[key]
+            value = value.strip()
+            if field in INT_FIELDS:
+                value = int(value) if value.isdigit() else None
+            hw_log[field] = value
+
+    return hw_log
@@ -1,8 +1,69 @@
 import os
+import sys
+import json
+import datetime
 import requests
 import koji
-import re
+import functools
+import itertools
 import logging
+import threading
+import time
+from collections import Counter, deque
+from collections.abc import MutableMapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from kojichannelvalidator.cache import HW_FIELDS, HwInfoCache, result_key
+from kojichannelvalidator.defaults import (
+    DEFAULT_PROFILE,
+    DESCRIPTION_MAX_AGE,
+    HTTP_POOL_SIZE,
+    HTTP_RETRIES,
+    HTTP_TIMEOUT,
+    SCRATCH_SEARCH_LIMIT,
+    SCRATCH_SEARCH_MAX,
+)
+from kojichannelvalidator.grouping import (
+    METRIC_LABELS,
+    RAM_TOLERANCE,
+    OrderedHostGrouper,
+    Thresholds,
+    check_limits,
+    cluster_hosts,
+    group_hosts,
+)
+from kojichannelvalidator.history import HistoryStore
+from kojichannelvalidator.hw_log import parse_hw_log
+from kojichannelvalidator.report import REPORTS, RecordedOutput, ShardReport
+from kojichannelvalidator.throttle import (
+    RETRY_STATUSES,
+    RetryableError,
+    Throttle,
+    ThrottledSession,
+    retry_after,
+)
+from kojichannelvalidator.timing import TIMINGS, TimedSession
+
+# Most hosts sent in each round of multicalls by the batched collection path
+BATCH_SIZE = 1000
+# Builds whose hw_info logs are read for each host by probe_hosts_sampled
+DEFAULT_SAMPLES = 3
+# Host description keys and the HwInfo field each describes. Descriptions
+# kept up to date by the builder playbooks use the Count and Memory keys.
+DESCRIPTION_KEYS = {
+    "CPU(s)": "cpus",
+    "vCPU Count": "cpus",
+    "CPU Count": "cpus",
+    "Ram": "ram_kb",
+    "Total Memory": "ram_kb",
+    "Disk": "disk",
+    "Kernel": "kernel",
+    "Operating System": "os",
+}
+# kB in each memory unit used in host descriptions
+MEMORY_UNITS = {"kb": 1, "mb": 1024, "gb": 1024**2, "tb": 1024**3}
+# Errors that fail the probe of a single host rather than the whole run
+PROBE_ERRORS = (koji.GenericError, requests.RequestException, RetryableError)
 
 
 class Channel:
@@ -10,208 +71,462 @@ class Channel:
     Koji build channel
     """
 
-    def __init__(self, name, id, cpus=8):
+    def __init__(self, name, id, cpus=8, thresholds=None):
         self.name = str(name)
         self.id = int(id)
         self.host_list = []
         self.config_groups = []
         self.min_cpus = cpus
+        self.thresholds = thresholds if thresholds != None else Thresholds()
+
+    def set_thresholds(self, thresholds):
+        """
+        Sets the grouping tolerances and limits of the channel, before any
+        host is grouped. A CPU(s) minimum in thresholds overrides min_cpus.
+        """
+        self.thresholds = thresholds
+        self.min_cpus = thresholds.minimum.get("cpus", self.min_cpus)
 
     def __str__(self):
         """
         Returns a str for a channel object
         """
-        channel_str = (
-            f"Channel: {self.name}\nChannel ID: {self.id}\nHosts in Channel: [\n"
-        )
-        for hosts in self.host_list:
-            channel_str += f"{hosts}\n"
-        channel_str += "]"
+        lines = [f"Channel: {self.name}", f"Channel ID: {self.id}", "Hosts in Channel: ["]
+        lines.extend(str(hosts) for hosts in self.host_list)
+        lines.append("]")
+
+        return "\n".join(lines)
 
-        return channel_str
+    def collect_hosts(self, ctx, known_hosts=None):
+        """
+        Finds all the hosts for the channel and adds them to host_list. If a
+        known_hosts dict of host id to Host is given, hosts already in it are
+        reused so that channels share Host objects, and new hosts are added.
+        """
+        for host in self.iter_hosts(ctx, known_hosts):
+            pass
 
-    def collect_hosts(self, session):
+    def iter_hosts(self, ctx, known_hosts=None):
         """
-        Finds all the hosts for the channel and adds them to host_list
+        Generator adding the hosts of the channel to host_list as listHosts
+        returns them, yielding each new host as it is added so it can be
+        probed straight away. Hosts already in known_hosts are reused and
+        added to host_list but not yielded, see collect_hosts.
         """
-        list_host_response = session.listHosts(channelID=self.id)
+        list_host_response = ctx.session.listHosts(channelID=self.id)
 
         for hosts in list_host_response:
-            self.host_list.append(
-                Host(
-                    name=hosts["name"],
-                    id=hosts["id"],
-                    enabled=hosts["enabled"],
-                    arches=hosts["arches"],
-                    description=hosts["description"],
-                )
+            if known_hosts != None and hosts["id"] in known_hosts:
+                self.host_list.append(known_hosts[hosts["id"]])
+                continue
+            new_host = Host(
+                name=hosts["name"],
+                id=hosts["id"],
+                enabled=hosts["enabled"],
+                arches=hosts["arches"],
+                description=hosts["description"],
             )
+            if known_hosts != None:
+                known_hosts[new_host.id] = new_host
+            self.host_list.append(new_host)
+            yield new_host
 
     def config_check(self):
         """
         returns a list of host configuration groupings for the channel. Hosts
-        are grouped together based on similar configurations.
+        are grouped together based on similar configurations, within the
+        tolerances of the channel's thresholds.
         """
-        hosts = self.host_list
-        config_groupings = []
-        grouped_set = set()
-
-        for i in range(len(hosts)):
-            if hosts[i] in grouped_set:
-                continue
-            new_grouping = [hosts[i]]
-            grouped_set.add(hosts[i])
-            for j in range(i + 1, len(hosts)):
-                if hosts[j] in grouped_set:
-                    continue
-                if compare_hosts(hosts[i], hosts[j]):
-                    new_grouping.append(hosts[j])
-                    grouped_set.add(hosts[j])
-            config_groupings.append(new_grouping)
-
-        self.config_groups = config_groupings
+        self.config_groups = cluster_hosts(self.host_list, self.thresholds.tolerance)
 
     def is_valid(self):
         """
-        Checks that all hosts in self.config_groups has a valid cpu count
+        Checks that all hosts in self.config_groups have a CPU count and that
+        their metrics are within the channel's minimum and maximum values,
+        all hosts being checked against the limits in one batch
         """
         flag = True
-        for group in self.config_groups:
-            for host in group:
-                try:
-                    if host.hw_dict["CPU(s)"] < self.min_cpus:
-                        logging.info(
-                            f'Host: {host.id} CPU(s): {host.hw_dict["CPU(s)"]} does not meet the minimum CPU count of {self.min_cpus}'
-                        )
-                        flag = False
-                except TypeError:
-                    logging.error(
-                        f'TYPE ERROR Host: {host.id} CPU count "{type(host.hw_dict["CPU(s)"])}"cannot be compared to type Int'
-                    )
-                    logging.info(
-                        "Note that a CPU(s) value of None may mean a hw_info.log was not found for the host."
-                    )
-                    flag = False
+        hosts = [host for group in self.config_groups for host in group]
+        for host in hosts:
+            if host.hw.cpus == None:
+                logging.error(
+                    f"Host: {host.id} has no CPU(s) count. This may mean a hw_info.log was not found for the host."
+                )
+                flag = False
+
+        minimum = dict(self.thresholds.minimum, cpus=self.min_cpus)
+        for host, metric, value, bound, limit in check_limits(
+            hosts, minimum, self.thresholds.maximum
+        ):
+            logging.info(
+                f"Host: {host.id} {METRIC_LABELS[metric]}: {value} does not meet the {bound} {METRIC_LABELS[metric]} of {limit}"
+            )
+            flag = False
 
         return flag
 
 
+def to_int(value):
+    """
+    Converts value to an int, returning None if it is not a whole number
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_kb(value):
+    """
+    Converts a memory size such as "23.497 gb" to kB. A number without a
+    unit is taken to be in kB already. Returns None if value is not a size.
+    """
+    parts = value.split()
+    if len(parts) == 1:
+        return to_int(parts[0])
+    if len(parts) != 2 or parts[1].lower() not in MEMORY_UNITS:
+        return None
+    try:
+        return int(float(parts[0]) * MEMORY_UNITS[parts[1].lower()])
+    except ValueError:
+        return None
+
+
+def parse_description(description):
+    """
+    Pulls hardware information from a host's description field
+
+    returns a dict of HwInfo field names to values and the date the
+    description was last updated, or None if it has no Updated line
+    """
+    fields = {}
+    updated = None
+    for line in description.split("\n"):
+        key, sep, value = line.partition(": ")
+        if sep == "":
+            continue
+        value = value.strip()
+        if key == "Updated":
+            try:
+                updated = datetime.date.fromisoformat(value)
+            except ValueError:
+                pass
+        elif key in DESCRIPTION_KEYS:
+            field = DESCRIPTION_KEYS[key]
+            if field == "cpus":
+                value = to_int(value)
+            elif field == "ram_kb":
+                value = to_kb(value)
+            fields[field] = value
+    return fields, updated
+
+
+class HwInfo:
+    """
+    Hardware information for a host. CPU(s) and Ram are always an int or
+    None, Ram is in kB.
+    """
+
+    __slots__ = (
+        "arches",
+        "cpus",
+        "ram_kb",
+        "disk",
+        "kernel",
+        "os",
+        "model_name",
+        "sockets",
+        "threads_per_core",
+        "swap_kb",
+        "mount",
+    )
+
+    # hw_dict key for each field
+    KEYS = {
+        "arches": "arches",
+        "CPU(s)": "cpus",
+        "Ram": "ram_kb",
+        "Disk": "disk",
+        "Kernel": "kernel",
+        "Operating System": "os",
+    }
+
+    def __init__(self, arches):
+        self.arches = arches
+        self.cpus = None
+        self.ram_kb = None
+        self.disk = None
+        self.kernel = None
+        self.os = None
+        self.model_name = None
+        self.sockets = None
+        self.threads_per_core = None
+        self.swap_kb = None
+        self.mount = None
+
+    def set(self, key, value):
+        """
+        Sets the field for a hw_dict key, converting CPU(s) and Ram to int
+        """
+        if key in ("CPU(s)", "Ram") and value != None:
+            value = to_int(value)
+        setattr(self, HwInfo.KEYS[key], value)
+
+    def update(self, fields):
+        """
+        Sets fields from a dict of field names to values, such as the result
+        of parse_hw_log. Fields with a value of None are left unchanged.
+        """
+        for field, value in fields.items():
+            if value != None:
+                setattr(self, field, value)
+
+    def log_fields(self):
+        """
+        returns the fields read from hw_info.log as a dict, the form they
+        are stored in the cache
+        """
+        return {field: getattr(self, field) for field in HW_FIELDS}
+
+
+class HwDict(MutableMapping):
+    """
+    Dict view of a HwInfo using the hw_info.log key names
+    """
+
+    __slots__ = ("hw",)
+
+    def __init__(self, hw):
+        self.hw = hw
+
+    def __getitem__(self, key):
+        return getattr(self.hw, HwInfo.KEYS[key])
+
+    def __setitem__(self, key, value):
+        self.hw.set(key, value)
+
+    def __delitem__(self, key):
+        raise TypeError("hw_dict keys cannot be removed")
+
+    def __iter__(self):
+        return iter(HwInfo.KEYS)
+
+    def __len__(self):
+        return len(HwInfo.KEYS)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
 class Host:
     """
     Koji build host
     """
 
+    __slots__ = (
+        "name",
+        "id",
+        "enabled",
+        "task_list",
+        "desc_str",
+        "hw",
+        "samples",
+        "disagreement",
+        "hw_log_read",
+    )
+
     def __init__(self, name, id, enabled, arches, description):
         self.name = str(name)
         self.id = int(id)
         self.enabled = bool(enabled)
         self.task_list = []
         self.desc_str = description
-        hw_keys = ["arches", "CPU(s)", "Ram", "Disk", "Kernel", "Operating System"]
-        self.hw_dict = {key: None for key in hw_keys}
-        self.hw_dict["arches"] = arches.split(" ")
+        self.hw = HwInfo(arches.split(" "))
+        # Set when the host is probed from several builds, see probe_hosts_sampled
+        self.samples = []
+        self.disagreement = None
+        # Set once hardware has been read from a hw_info.log, or from the
+        # cache or a snapshot of one, rather than only from the description
+        self.hw_log_read = False
         # Sometimes the description field is None
         if description != None:
             description_list = description.split("\n")
             for lines in description_list:
                 line_split = lines.split(": ")
-                if line_split[0] in hw_keys:
-                    self.hw_dict[line_split[0]] = line_split[1]
+                if line_split[0] in HwInfo.KEYS and line_split[0] != "arches":
+                    self.hw.set(line_split[0], line_split[1])
+
+    @property
+    def hw_dict(self):
+        """
+        Hardware information keyed by hw_info.log names
+        """
+        return HwDict(self.hw)
 
     def __str__(self):
         """
         Returns a string for the host object
         """
-        host_str = f"Host Name: {self.name}\nHost ID: {self.id}\nEnabled: {self.enabled}\nTask List: [\n"
-        for tasks in self.task_list:
-            host_str += f"tasks: {tasks}"
-        host_str += "]\n"
-        host_str += "hw_info: {\n"
-        for key in self.hw_dict.keys():
-            host_str += f"{key}: {self.hw_dict[key]}\n"
-        host_str += "}"
-        return host_str
+        parts = [
+            f"Host Name: {self.name}\nHost ID: {self.id}\nEnabled: {self.enabled}\nTask List: [\n"
+        ]
+        parts.extend(f"tasks: {tasks}" for tasks in self.task_list)
+        parts.append("]\nhw_info: {\n")
+        parts.extend(f"{key}: {value}\n" for key, value in self.hw_dict.items())
+        parts.append("}")
+        return "".join(parts)
 
-    def find_builds_for_host(self, session):
+    def find_builds_for_host(self, session, search_limit=SCRATCH_SEARCH_MAX):
         """
-        Tries to find a non scratch build for the host
+        Tries to find a non scratch build for the host. The hosts closed
+        buildArch tasks are searched newest first in pages that double in
+        size, starting with just the newest task, until a task with a build
+        is found or search_limit tasks have been checked. The builds for each
+        page's parent tasks are looked up in a single multicall.
         """
         logging.info(
             f"\n===========================================================================\nStarting find_builds_for_host for host: {self.id}"
         )
-        opts = {
-            "host_id": self.id,
-            "method": "buildArch",
-            "state": [koji.TASK_STATES["CLOSED"]],
-            "decode": "True",
-        }
-        queryOpts = {"limit": 1, "order": "-completion_time"}
-
-        tasks = session.listTasks(opts, queryOpts)
-
-        # Don't add any tasks if none are found for the host
-        if len(tasks) == 0:
-            logging.info("NO TASKS FOUND. No tasks found on host %s", self.id)
-            return
-
-        # Check build info for task and check for scratch build
-        parent_id = tasks[0]["parent"]
-        build = session.listBuilds(taskID=parent_id)
-        # Scratch build is found if build info is empty. Retry query opts
-        # for past 10 builds for the host
-        if len(build) == 0:
-            queryOpts = {"limit": 10, "order": "-completion_time"}
+        start = time.monotonic()
+        hub_calls = 0
+        opts = buildarch_task_opts(self.id)
+        checked_parents = set()
+        offset = 0
+        page_size = 1
 
+        while offset < search_limit:
+            queryOpts = {
+                "limit": min(page_size, search_limit - offset),
+                "offset": offset,
+                "order": "-completion_time",
+            }
             tasks = session.listTasks(opts, queryOpts)
+            hub_calls += 1
+            if len(tasks) == 0:
+                break
+
+            # Scratch builds have no build info. Koji cannot filter scratch
+            # parents in listTasks, so check each new parent for a build.
+            parent_ids = []
             for koji_task in tasks:
-                parent_id = koji_task["parent"]
+                if koji_task["parent"] not in checked_parents:
+                    checked_parents.add(koji_task["parent"])
+                    parent_ids.append(koji_task["parent"])
+            with session.multicall() as m:
+                build_calls = [m.listBuilds(taskID=parent_id) for parent_id in parent_ids]
+            hub_calls += 1
+            builds = {
+                parent_id: multicall_result(call, [])
+                for parent_id, call in zip(parent_ids, build_calls)
+            }
 
-                build = session.listBuilds(taskID=parent_id)
+            for koji_task in tasks:
+                build = builds.get(koji_task["parent"], [])
                 if len(build) != 0:
-                    logging.info("TASK FOUND. Task found for host: %s", self.id)
-                    self.task_list.append(
-                        Task(
-                            task_id=koji_task["id"],
-                            parent_id=koji_task["parent"],
-                            build_info=build[0],
-                        )
-                    )
+                    logging.info("TASK FOUND. Task found for host %s", self.id)
+                    self.add_task(koji_task, build[0])
                     break
-        else:
-            logging.info("TASK FOUND. Task found for host %s", self.id)
+            offset += len(tasks)
+            if len(self.task_list) != 0 or len(tasks) < queryOpts["limit"]:
+                break
+            page_size *= 2
+
+        if len(self.task_list) == 0:
+            logging.info(
+                "NO TASKS FOUND. No non scratch build in the last %s tasks on host %s",
+                offset,
+                self.id,
+            )
+        logging.info(
+            f"find_builds_for_host for host {self.id} made {hub_calls} hub calls in {time.monotonic() - start:.3f}s"
+        )
+
+    def add_task(self, koji_task, build_info):
+        """
+        Adds a task to task_list from a listTasks entry and its build info
+        """
+        self.task_list.append(
+            Task(
+                task_id=koji_task["id"],
+                parent_id=koji_task["parent"],
+                build_id=build_info["build_id"],
+            )
+        )
+
+    def load_from_cache(self, cache):
+        """
+        Loads the hosts last good build and its hardware information from
+        cache. Returns True if both were found.
+        """
+        cached = cache.get_host_build(self.id)
+        if cached == None:
+            return False
+        hw_info = cache.get_hw_info(cached["build_id"], cached["log_dir"])
+        if hw_info == None:
+            return False
+
+        logging.info(f"CACHE HIT. Using build {cached['build_id']} for host {self.id}")
+        self.task_list.append(
+            Task(
+                task_id=cached["task_id"],
+                parent_id=cached["parent_id"],
+                build_id=cached["build_id"],
+            )
+        )
+        self.hw.update(hw_info)
+        self.hw_log_read = True
+        return True
+
+    def snapshot(self, last_task_id):
+        """
+        Returns the snapshot saved for the host by incremental runs, where
+        last_task_id is the newest buildArch task seen for the host
+        """
+        task = self.task_list[0] if len(self.task_list) != 0 else None
+        return dict(
+            self.hw.log_fields(),
+            last_task_id=last_task_id,
+            task_id=task.task_id if task != None else None,
+            parent_id=task.parent_id if task != None else None,
+            build_id=task.build_id if task != None else None,
+        )
+
+    def load_snapshot(self, snapshot):
+        """
+        Loads the build and hardware information from a snapshot saved by a
+        previous incremental run
+        """
+        if snapshot["build_id"] != None:
             self.task_list.append(
                 Task(
-                    task_id=tasks[0]["id"],
-                    parent_id=tasks[0]["parent"],
-                    build_info=build[0],
+                    task_id=snapshot["task_id"],
+                    parent_id=snapshot["parent_id"],
+                    build_id=snapshot["build_id"],
                 )
             )
-        logging.info(f"Successful return from find_builds_for_hosts")
+        self.hw.update({field: snapshot[field] for field in HW_FIELDS})
+        self.hw_log_read = snapshot["build_id"] != None
 
-    def get_hw_info(self, session):
+    def get_hw_info(self, ctx, session=None):
         """
         Gets hardware information for a host. Downloads hw_info.log for the
-        hosts architecture and pulls hardware information from the log.
+        hosts architecture and pulls hardware information from the log. The
+        hub is called through session, or ctx.session if it is not given.
         """
-        logging.info(
-            f"Start get_hw_info for host {self.id} using task:\n\t{self.task_list[0]}"
-        )
         if len(self.task_list) == 0:
             logging.info(
                 f"No tasks found in the tasklist of host {self.id}. Unable to find hw_info log without a task"
             )
             return False
+        logging.info(
+            f"Start get_hw_info for host {self.id} using task:\n\t{self.task_list[0]}"
+        )
 
-        build_id = self.task_list[0].build_info["build_id"]
+        if session == None:
+            session = ctx.session
+        build_id = self.task_list[0].build_id
         all_logs = session.getBuildLogs(build_id)
-        hw_log = None
-        for log in all_logs:
-            if log["name"] == "hw_info.log" and log["dir"] in self.hw_dict["arches"]:
-                hw_log = log
-                break
-            elif log["name"] == "hw_info.log" and log["dir"] == "noarch":
-                hw_log = log
-                break
+        hw_log = self.select_hw_log(all_logs)
 
         # Check if hw_logs has been assigned
         if hw_log == None:
@@ -220,48 +535,231 @@ class Host:
             )
             return False
 
-        # Make URL for hw_log and use requests.get(url) to download log
-        mykoji = koji.get_profile_module("brew")
-        url = os.path.join(mykoji.config.topurl, hw_log["path"])
-        response = requests.get(url)
-        hw_log_str = response.text
+        self.read_hw_log(ctx, hw_log)
 
-        hw_log_lines = hw_log_str.split("\n")
-        hw_log_lines = [re.sub(r"\s+", ",", line) for line in hw_log_lines]
+        logging.info("Successful return from get_hw_info")
+        return True
 
-        for line in hw_log_lines:
-            line_split = line.split(",")
+    def select_hw_log(self, all_logs, arch=None):
+        """
+        Returns the hw_info.log entry matching the hosts architecture from a
+        list of build logs, or None if there is no such log. If arch, the
+        arch of the task that ran on the host, is given and is one of the
+        hosts arches its log is preferred.
+        """
+        if arch in self.hw.arches:
+            for log in all_logs:
+                if log["name"] == "hw_info.log" and log["dir"] == arch:
+                    return log
+        for log in all_logs:
+            if log["name"] == "hw_info.log" and log["dir"] in self.hw.arches:
+                return log
+            elif log["name"] == "hw_info.log" and log["dir"] == "noarch":
+                return log
+        return None
 
-            if line_split[0] == "CPU(s):":
-                self.hw_dict["CPU(s)"] = int(line_split[1])
-                continue
-            if line_split[0] == "Mem:":
-                self.hw_dict["Ram"] = int(line_split[1])
-                continue
-            disk_match = re.match(r"^/", line_split[0])
-            if disk_match:
-                self.hw_dict["Disk"] = line_split[1]
-                continue
+    def read_hw_log(self, ctx, hw_log):
+        """
+        Downloads a hw_info.log and pulls hardware information from it. The
+        log is streamed through ctx.http and reading stops once the Storage
+        section has been parsed. If ctx has a cache, the download is skipped
+        when the log has already been parsed and new results are stored in
+        the cache.
+        """
+        cache = ctx.cache
+        task = self.task_list[0]
+        build_id = task.build_id
+        if cache != None:
+            hw_info = cache.get_hw_info(build_id, hw_log["dir"])
+            if hw_info != None:
+                self.hw.update(hw_info)
+                self.hw_log_read = True
+                cache.put_host_build(
+                    self.id, task.task_id, task.parent_id, build_id, hw_log["dir"]
+                )
+                return
 
-        logging.info("Successful return from get_hw_info")
-        return True
+        fields = download_hw_log(ctx, hw_log, self.id)
+        self.hw.update(fields)
+        self.hw_log_read = True
+
+        # Only what the log holds is cached, not values from the description
+        if cache != None and fields["cpus"] != None:
+            cache.put_hw_info(build_id, hw_log["dir"], fields)
+            cache.put_host_build(
+                self.id, task.task_id, task.parent_id, build_id, hw_log["dir"]
+            )
+
+
+def download_hw_log(ctx, hw_log, host_id):
+    """
+    Streams a hw_info.log from the download server through ctx.http and
+    pulls hardware information from it
+
+    returns the parsed fields, see parse_hw_log
+    """
+    url = ctx.log_url(hw_log["path"])
+    with TIMINGS.timed("http.hw_info", host_id):
+        # parse_hw_log stops reading at the end of the Storage section
+        return ctx.http.fetch(url, parse_hw_log)
+
+
+class LogSession(requests.Session):
+    """
+    Pooled keep-alive HTTP session for downloading build logs. Requests made
+    through it get a default timeout and go through a Throttle for the
+    download server, which limits them to rate requests a second, adapts
+    how many are in flight, up to pool_size, and retries failed connections
+    and server errors. Use fetch for streamed downloads, so the whole body
+    is read within the Throttle.
+    """
+
+    def __init__(
+        self,
+        pool_size=HTTP_POOL_SIZE,
+        timeout=HTTP_TIMEOUT,
+        retries=HTTP_RETRIES,
+        rate=None,
+    ):
+        super().__init__()
+        self.timeout = timeout
+        self.throttle = Throttle(
+            "download", rate=rate, concurrency=pool_size, retries=retries
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+        # Set while fetch holds a Throttle slot for the thread
+        self.local = threading.local()
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        if getattr(self.local, "fetching", False):
+            return self.send_request(method, url, **kwargs)
+        return self.throttle.call(self.send_request, method, url, **kwargs)
+
+    def fetch(self, url, parse):
+        """
+        Streams url and returns parse called with an iterator over the lines
+        of the body. The request and reading the body happen within a single
+        Throttle call, so the concurrency limit covers the whole download and
+        a download that fails part way through the body is retried.
+        """
+
+        def read():
+            self.local.fetching = True
+            try:
+                response = self.get(url, stream=True)
+                try:
+                    return parse(response.iter_lines())
+                finally:
+                    response.close()
+            finally:
+                self.local.fetching = False
+
+        return self.throttle.call(read)
+
+    def send_request(self, method, url, **kwargs):
+        response = super().request(method, url, **kwargs)
+        if response.status_code in RETRY_STATUSES:
+            response.close()
+            raise RetryableError(
+                f"{response.status_code} from {url}", retry_after(response)
+            )
+        return response
+
+
+class RunContext:
+    """
+    Everything shared by the channels and hosts of a run: the koji profile,
+    loaded once, the hub session, the HTTP client for downloading build logs,
+    the optional cache and the probing options. Hub calls go through
+    hub_throttle, which by default only retries calls that fail because the
+    hub is unavailable. server and topurl override the profile's, and when
+    both topurl and session_factory are given no profile is loaded at all,
+    so any hub or a local stand-in can be used.
+    """
+
+    def __init__(
+        self,
+        profile=DEFAULT_PROFILE,
+        server=None,
+        topurl=None,
+        session_factory=None,
+        http=None,
+        cache=None,
+        jobs=1,
+        search_limit=SCRATCH_SEARCH_MAX,
+        hub_throttle=None,
+    ):
+        self.profile = profile
+        self.opts = {}
+        self.client_session = None
+        if session_factory == None or topurl == None:
+            mykoji = koji.get_profile_module(profile)
+            self.opts = vars(mykoji.config)
+            self.client_session = mykoji.ClientSession
+        self.server = server or self.opts.get("server")
+        self.topurl = topurl or self.opts.get("topurl")
+        self.session_factory = session_factory or self.profile_session
+        self.http = http if http != None else LogSession()
+        self.cache = cache
+        self.jobs = jobs
+        self.search_limit = search_limit
+        self.hub_throttle = hub_throttle if hub_throttle != None else Throttle("hub")
+        self.main_session = None
+
+    @property
+    def session(self):
+        """
+        Hub session for calls made from the main thread, created on first use
+        """
+        if self.main_session == None:
+            self.main_session = self.new_session()
+        return self.main_session
+
+    def profile_session(self):
+        return self.client_session(self.server, self.opts)
+
+    def new_session(self):
+        """
+        Returns a new hub session. Koji sessions are not safe to share
+        between threads, so each worker thread makes its own.
+        """
+        session = ThrottledSession(self.session_factory(), self.hub_throttle)
+        if TIMINGS.enabled:
+            return TimedSession(session, TIMINGS)
+        return session
+
+    def log_url(self, path):
+        """
+        Returns the download URL of a build log from its path
+        """
+        return os.path.join(self.topurl, path)
+
+    def close(self):
+        self.http.close()
+        if self.cache != None:
+            self.cache.close()
 
 
 class Task:
     """
-    Koji task
+    Koji task, keeping only the build id from the task's build info
     """
 
-    def __init__(self, task_id, parent_id, build_info):
+    __slots__ = ("task_id", "parent_id", "build_id")
+
+    def __init__(self, task_id, parent_id, build_id):
         self.task_id = int(task_id)
         self.parent_id = int(parent_id)
-        self.build_info = build_info
+        self.build_id = int(build_id)
 
     def __str__(self):
         """
         Returns a string for a task object
         """
-        task_str = f"Task ID: {self.task_id}\n\tParent ID: {self.parent_id}\n\tBuild Info: {self.build_info}"
+        task_str = f"Task ID: {self.task_id}\n\tParent ID: {self.parent_id}\n\tBuild ID: {self.build_id}"
         return task_str
 
 
@@ -271,33 +769,716 @@ def compare_hosts(hostA, hostB):
     """
     similar = True
 
-    if hostA.hw_dict["Ram"] != None and hostB.hw_dict["Ram"] != None:
-        a_ram = int(hostA.hw_dict["Ram"])
-        b_ram = int(hostB.hw_dict["Ram"])
-        ram_tol = 4000000  # 4gb tolerance for ram similarity
+    if hostA.hw.ram_kb != None and hostB.hw.ram_kb != None:
+        a_ram = hostA.hw.ram_kb
+        b_ram = hostB.hw.ram_kb
+        ram_tol = RAM_TOLERANCE
         if b_ram < a_ram - ram_tol or b_ram > a_ram + ram_tol:
             similar = False
 
-    if hostA.hw_dict["CPU(s)"] != hostB.hw_dict["CPU(s)"]:
+    if hostA.hw.cpus != hostB.hw.cpus:
         similar = False
 
     return similar
 
 
-def collect_channels(session):
+def probe_host(host, ctx, session=None):
+    """
+    Runs the per-host pipeline: finds a build for the host and pulls its
+    hardware information from the build's hw_info.log. Hosts with a fresh
+    entry in ctx.cache are not probed. The hub is called through session, or
+    ctx.session if it is not given. If the hub or download server still
+    fails after its retries the error is logged and the host is left without
+    hardware information, for is_valid to report.
+    """
+    if session == None:
+        session = ctx.session
+    with TIMINGS.host(host.id), TIMINGS.timed("probe_host"):
+        if ctx.cache != None and host.load_from_cache(ctx.cache):
+            return host
+        try:
+            with TIMINGS.timed("find_builds_for_host"):
+                host.find_builds_for_host(session, ctx.search_limit)
+            with TIMINGS.timed("get_hw_info"):
+                host.get_hw_info(ctx, session)
+        except PROBE_ERRORS as err:
+            logging.error(f"Probing host {host.id} failed: {err}")
+    return host
+
+
+def ordered_map(executor, fn, items, window):
+    """
+    Like executor.map, but only takes up to window items from items ahead of
+    the results yielded so far, so items can be a lazy generator
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while len(pending) != 0:
+        yield pending.popleft().result()
+
+
+def probe_hosts(hosts, ctx, on_probed=None):
+    """
+    Probes every host in hosts using at most ctx.jobs worker threads. Each
+    worker thread creates its own session with ctx.new_session, since koji
+    sessions are not safe to share between threads. The number of in-flight
+    hub requests is bounded by ctx.jobs. hosts may be a generator, which is
+    only read a few hosts ahead of the probes. If on_probed is given it is
+    called with each host, in order, as soon as the host has been probed.
+
+    returns the probed hosts in the same order they were given
+    """
+    jobs = ctx.jobs
+    local = threading.local()
+
+    def worker(host):
+        if not hasattr(local, "session"):
+            local.session = ctx.new_session()
+        return probe_host(host, ctx, local.session)
+
+    def collect(probed):
+        probed_hosts = []
+        for host in probed:
+            probed_hosts.append(host)
+            if on_probed != None:
+                on_probed(host)
+        return probed_hosts
+
+    if jobs <= 1:
+        return collect(map(worker, hosts))
+    # The executor is shut down even if on_probed or the hosts generator raise
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return collect(ordered_map(executor, worker, hosts, jobs * 2))
+
+
+def buildarch_task_opts(host_id):
+    """
+    Returns the listTasks opts for closed buildArch tasks run on a host
+    """
+    return {
+        "host_id": host_id,
+        "method": "buildArch",
+        "state": [koji.TASK_STATES["CLOSED"]],
+        "decode": "True",
+    }
+
+
+def multicall_result(call, default):
+    """
+    Returns the result of a call made in a multicall. If the hub returned a
+    fault for the call it is logged and default is returned instead.
+    """
+    try:
+        return call.result
+    except koji.GenericError as err:
+        logging.error(f"{call.method} call failed in multicall: {err}")
+        return default
+
+
+def probe_hosts_batched(hosts, ctx, on_probed=None, from_cache=True):
+    """
+    Probes every host in hosts using a fixed number of hub round trips for
+    each BATCH_SIZE hosts. hosts may be a generator, which is read one batch
+    at a time. See probe_batch.
+
+    returns the probed hosts in the same order they were given
+    """
+    hosts = iter(hosts)
+    probed_hosts = []
+    while True:
+        batch = list(itertools.islice(hosts, BATCH_SIZE))
+        if len(batch) == 0:
+            return probed_hosts
+        probed_hosts.extend(probe_batch(batch, ctx, on_probed, from_cache))
+
+
+def probe_batch(hosts, ctx, on_probed=None, from_cache=True):
+    """
+    Probes every host in hosts using a fixed number of hub round trips. The
+    listTasks, listBuilds and getBuildLogs calls for all hosts are each sent
+    in a single multicall, then the hw_info logs are downloaded using at most
+    ctx.jobs worker threads. Unless from_cache is False, hosts with a fresh
+    entry in ctx.cache are left out of the multicalls. If on_probed is given
+    it is called with each host as soon as the host has been probed.
+
+    returns the probed hosts in the same order they were given
+    """
+    session = ctx.session
+    all_hosts = list(hosts)
+    hosts = all_hosts
+    if ctx.cache != None and from_cache:
+        hosts = []
+        for host in all_hosts:
+            if not host.load_from_cache(ctx.cache):
+                hosts.append(host)
+            elif on_probed != None:
+                on_probed(host)
+    if len(hosts) == 0:
+        return all_hosts
+    queryOpts = {"limit": SCRATCH_SEARCH_LIMIT, "order": "-completion_time"}
+
+    with session.multicall() as m:
+        task_calls = [
+            m.listTasks(buildarch_task_opts(host.id), queryOpts) for host in hosts
+        ]
+    host_tasks = [multicall_result(call, []) for call in task_calls]
+
+    # Several tasks may share a parent, only look each parent up once
+    parent_ids = list(
+        dict.fromkeys(koji_task["parent"] for tasks in host_tasks for koji_task in tasks)
+    )
+    with session.multicall() as m:
+        build_calls = [m.listBuilds(taskID=parent_id) for parent_id in parent_ids]
+    builds = {
+        parent_id: multicall_result(call, [])
+        for parent_id, call in zip(parent_ids, build_calls)
+    }
+
+    # Tasks are newest first, so the first task with a build is the most
+    # recent non scratch build for the host
+    for host, tasks in zip(hosts, host_tasks):
+        for koji_task in tasks:
+            build = builds[koji_task["parent"]]
+            if len(build) != 0:
+                logging.info("TASK FOUND. Task found for host %s", host.id)
+                host.add_task(koji_task, build[0])
+                break
+        else:
+            logging.info("NO TASKS FOUND. No builds found on host %s", host.id)
+
+    found = [host for host in hosts if len(host.task_list) != 0]
+    with session.multicall() as m:
+        log_calls = [
+            m.getBuildLogs(host.task_list[0].build_id) for host in found
+        ]
+
+    downloads = {}
+    for host, call in zip(found, log_calls):
+        all_logs = multicall_result(call, [])
+        hw_log = host.select_hw_log(all_logs)
+        if hw_log == None:
+            logging.info(
+                f"No hw_log found for host: {host.id} all logs for build: {all_logs}"
+            )
+            continue
+        downloads[host.id] = hw_log
+
+    def download(host):
+        if host.id in downloads:
+            try:
+                host.read_hw_log(ctx, downloads[host.id])
+            except PROBE_ERRORS as err:
+                logging.error(f"Probing host {host.id} failed: {err}")
+        return host
+
+    with ThreadPoolExecutor(max_workers=max(ctx.jobs, 1)) as executor:
+        for host in executor.map(download, hosts):
+            if on_probed != None:
+                on_probed(host)
+
+    return all_hosts
+
+
+def probe_hosts_incremental(hosts, ctx, on_probed=None, probe=None):
+    """
+    Probes only the hosts whose newest closed buildArch task has changed
+    since the snapshot saved in ctx.cache by the previous incremental run. The
+    newest task for every host is looked up with a single multicall, hosts
+    whose task is unchanged are loaded from their snapshot and the rest are
+    probed with probe, or probe_hosts_batched if it is not given. Snapshots
+    are then saved for the probed hosts whose hw_info.log was read, so a
+    host whose probe failed is probed again by the next run. If on_probed is
+    given it is called with each host as soon as it has been probed or
+    loaded.
+
+    returns the probed hosts in the same order they were given
+    """
+    session = ctx.session
+    cache = ctx.cache
+    hosts = list(hosts)
+    queryOpts = {"limit": 1, "order": "-completion_time"}
+
+    with session.multicall() as m:
+        task_calls = [
+            m.listTasks(buildarch_task_opts(host.id), queryOpts) for host in hosts
+        ]
+
+    changed = []
+    newest_task_ids = {}
+    for host, call in zip(hosts, task_calls):
+        tasks = multicall_result(call, None)
+        if tasks == None:
+            changed.append(host)
+            continue
+        newest_task_ids[host.id] = tasks[0]["id"] if len(tasks) != 0 else None
+        snapshot = cache.get_snapshot(host.id)
+        if snapshot != None and snapshot["last_task_id"] == newest_task_ids[host.id]:
+            logging.info(f"UNCHANGED. Using snapshot for host {host.id}")
+            host.load_snapshot(snapshot)
+            if on_probed != None:
+                on_probed(host)
+            continue
+        changed.append(host)
+
+    logging.info(f"{len(changed)}/{len(hosts)} hosts changed since the last run")
+    if probe == None:
+        probe = functools.partial(probe_hosts_batched, from_cache=False)
+    probe(changed, ctx, on_probed=on_probed)
+
+    # Hosts whose probe failed get no snapshot, so the next run probes them.
+    # Their CPU(s) may still be known from the description, so it is whether
+    # a hw_info.log was read that tells a probe worked.
+    for host in changed:
+        if host.id in newest_task_ids and host.hw_log_read:
+            cache.put_snapshot(host.id, host.snapshot(newest_task_ids[host.id]))
+
+    return hosts
+
+
+class HwSample:
+    """
+    Hardware read from the hw_info.log of one of the builds sampled for a host
+    """
+
+    __slots__ = ("task", "log_dir", "hw")
+
+    def __init__(self, task, log_dir, hw):
+        self.task = task
+        self.log_dir = log_dir
+        self.hw = hw
+
+
+def sample_consensus(samples, ram_tol=RAM_TOLERANCE):
+    """
+    Works out a host's hardware from samples, ordered newest first. CPU(s) is
+    the most common count, ties going to the newest sample, and Ram is the
+    median. The other fields are taken from the newest sample that has them.
+    CPU(s) disagree when the samples differ and Ram when they are more than
+    ram_tol apart.
+
+    returns a dict of HwInfo fields and a dict of the values of each field
+    the samples disagree on
+    """
+    fields = {}
+    for sample in reversed(samples):
+        for field in HwInfo.__slots__[1:]:
+            value = getattr(sample.hw, field)
+            if value != None:
+                fields[field] = value
+
+    disagreement = {}
+    cpus = Counter(sample.hw.cpus for sample in samples if sample.hw.cpus != None)
+    if len(cpus) != 0:
+        fields["cpus"] = cpus.most_common(1)[0][0]
+        if len(cpus) > 1:
+            disagreement["cpus"] = sorted(cpus)
+    ram = sorted(sample.hw.ram_kb for sample in samples if sample.hw.ram_kb != None)
+    if len(ram) != 0:
+        fields["ram_kb"] = ram[(len(ram) - 1) // 2]
+        if ram[-1] - ram[0] > ram_tol:
+            disagreement["ram_kb"] = sorted(set(ram))
+    return fields, disagreement
+
+
+def probe_hosts_sampled(hosts, ctx, on_probed=None, samples=DEFAULT_SAMPLES):
+    """
+    Probes every host in hosts from the hw_info logs of its last samples non
+    scratch builds, rather than only the newest one. hosts may be a
+    generator, which is read one batch at a time. See probe_sample_batch.
+
+    returns the probed hosts in the same order they were given
+    """
+    hosts = iter(hosts)
+    probed_hosts = []
+    while True:
+        batch = list(itertools.islice(hosts, BATCH_SIZE))
+        if len(batch) == 0:
+            return probed_hosts
+        probed_hosts.extend(probe_sample_batch(batch, ctx, on_probed, samples))
+
+
+def probe_sample_batch(hosts, ctx, on_probed=None, samples=DEFAULT_SAMPLES):
+    """
+    Probes every host in hosts from its last samples non scratch builds using
+    a fixed number of hub round trips. The listTasks, listBuilds and
+    getBuildLogs calls for all hosts are each sent in a single multicall,
+    then every sampled hw_info log is downloaded and parsed using at most
+    ctx.jobs worker threads, so sampling more builds adds downloads rather
+    than round trips. Each host gets the consensus hardware of its samples,
+    and the values they disagree on in host.disagreement, see
+    sample_consensus. If on_probed is given it is called with each host, in
+    order, as soon as all its samples have been read.
+
+    returns the probed hosts in the same order they were given
+    """
+    session = ctx.session
+    hosts = list(hosts)
+    # Leave room for scratch builds, which have no build info
+    queryOpts = {"limit": samples + SCRATCH_SEARCH_LIMIT, "order": "-completion_time"}
+
+    with session.multicall() as m:
+        task_calls = [
+            m.listTasks(buildarch_task_opts(host.id), queryOpts) for host in hosts
+        ]
+    host_tasks = [multicall_result(call, []) for call in task_calls]
+
+    parent_ids = list(
+        dict.fromkeys(koji_task["parent"] for tasks in host_tasks for koji_task in tasks)
+    )
+    with session.multicall() as m:
+        build_calls = [m.listBuilds(taskID=parent_id) for parent_id in parent_ids]
+    builds = {
+        parent_id: multicall_result(call, [])
+        for parent_id, call in zip(parent_ids, build_calls)
+    }
+
+    # Tasks are newest first. A build is only sampled once per host, since
+    # its tasks for other arches may have run on the same host
+    sampled = []
+    for host, tasks in zip(hosts, host_tasks):
+        build_ids = set()
+        for koji_task in tasks:
+            build = builds[koji_task["parent"]]
+            if len(build) == 0 or build[0]["build_id"] in build_ids:
+                continue
+            build_ids.add(build[0]["build_id"])
+            host.add_task(koji_task, build[0])
+            sampled.append((host, host.task_list[-1], koji_task.get("arch")))
+            if len(build_ids) >= samples:
+                break
+        if len(build_ids) == 0:
+            logging.info("NO TASKS FOUND. No builds found on host %s", host.id)
+
+    build_ids = list(dict.fromkeys(task.build_id for host, task, arch in sampled))
+    with session.multicall() as m:
+        log_calls = [m.getBuildLogs(build_id) for build_id in build_ids]
+    build_logs = {
+        build_id: multicall_result(call, [])
+        for build_id, call in zip(build_ids, log_calls)
+    }
+
+    downloads = []
+    for host, task, arch in sampled:
+        all_logs = build_logs[task.build_id]
+        hw_log = host.select_hw_log(all_logs, arch)
+        if hw_log == None:
+            logging.info(
+                f"No hw_log found for host: {host.id} all logs for build: {all_logs}"
+            )
+            continue
+        downloads.append((host, task, hw_log))
+
+    def download(item):
+        host, task, hw_log = item
+        sample = HwSample(task, hw_log["dir"], HwInfo(host.hw.arches))
+        cache = ctx.cache
+        if cache != None:
+            hw_info = cache.get_hw_info(task.build_id, hw_log["dir"])
+            if hw_info != None:
+                sample.hw.update(hw_info)
+                return sample
+        try:
+            sample.hw.update(download_hw_log(ctx, hw_log, host.id))
+        except PROBE_ERRORS as err:
+            logging.error(
+                f"Reading build {task.build_id} for host {host.id} failed: {err}"
+            )
+            return None
+        if cache != None and sample.hw.cpus != None:
+            cache.put_hw_info(task.build_id, hw_log["dir"], sample.hw.log_fields())
+        return sample
+
+    # Downloads are in host order, so each host's samples come back together
+    counts = Counter(host.id for host, task, hw_log in downloads)
+    with ThreadPoolExecutor(max_workers=max(ctx.jobs, 1)) as executor:
+        results = executor.map(download, downloads)
+        for host in hosts:
+            for _ in range(counts[host.id]):
+                sample = next(results)
+                if sample != None:
+                    host.samples.append(sample)
+            fields, host.disagreement = sample_consensus(host.samples)
+            host.hw.update(fields)
+            host.hw_log_read = len(host.samples) != 0
+            if len(host.disagreement) != 0:
+                logging.warning(
+                    f"Builds sampled for host {host.id} disagree: {host.disagreement}"
+                )
+            if on_probed != None:
+                on_probed(host)
+
+    return hosts
+
+
+class DescribedHost:
+    """
+    Hardware a host's description claims, for grouping hosts before any
+    hw_info.log is read
+    """
+
+    __slots__ = ("host", "hw", "updated")
+
+    def __init__(self, host):
+        self.host = host
+        self.hw = HwInfo(host.hw.arches)
+        self.updated = None
+        if host.desc_str != None:
+            fields, self.updated = parse_description(host.desc_str)
+            self.hw.update(fields)
+
+
+def split_described_hosts(hosts, max_age=DESCRIPTION_MAX_AGE, today=None):
+    """
+    Splits hosts into those whose description can stand in for their
+    hw_info.log and those that still have to be probed. A description is
+    not used if it is missing CPU(s) or Ram, if it was updated more than
+    max_age days before today, or if it is inconsistent with the hosts of
+    the same arches: grouped by CPU(s) and Ram, only the hosts in the single
+    largest group of their arches are described well enough.
+
+    returns a list of DescribedHost to trust and a list of hosts to probe
+    """
+    if today == None:
+        today = datetime.date.today()
+    peers = {}
+    probe = []
+    for host in hosts:
+        described = DescribedHost(host)
+        if described.hw.cpus == None or described.hw.ram_kb == None:
+            probe.append(host)
+        elif (
+            max_age != None
+            and described.updated != None
+            and (today - described.updated).days > max_age
+        ):
+            probe.append(host)
+        else:
+            peers.setdefault(frozenset(host.hw.arches), []).append(described)
+
+    trusted = []
+    for described_hosts in peers.values():
+        groups = group_hosts(described_hosts)
+        sizes = Counter(len(group) for group in groups)
+        largest = max(sizes)
+        for group in groups:
+            if len(group) == largest and sizes[largest] == 1:
+                trusted.extend(group)
+            else:
+                probe.extend(described.host for described in group)
+    return trusted, probe
+
+
+def probe_hosts_tiered(
+    hosts, ctx, on_probed=None, probe=None, max_age=DESCRIPTION_MAX_AGE
+):
+    """
+    Validates hosts from the description fields already returned by
+    listHosts where they can be trusted, see split_described_hosts, and
+    probes only the rest with probe, probe_hosts by default. If on_probed is
+    given it is called with each host as soon as its hardware is known.
+
+    returns the hosts in the same order they were given
+    """
+    hosts = list(hosts)
+    if probe == None:
+        probe = probe_hosts
+    trusted, untrusted = split_described_hosts(hosts, max_age)
+    logging.info(
+        f"{len(trusted)}/{len(hosts)} hosts validated from their description"
+    )
+
+    for described in trusted:
+        described.host.hw.update(
+            {
+                field: getattr(described.hw, field)
+                for field in ("cpus", "ram_kb", "disk", "kernel", "os")
+            }
+        )
+        if on_probed != None:
+            on_probed(described.host)
+
+    if len(untrusted) != 0:
+        probe(untrusted, ctx, on_probed=on_probed)
+    return hosts
+
+
+def collect_channels(ctx):
     """
     Collects koji channels from koji and creates
     objects for them
 
     returns a list of channel objects
     """
-    channel_objects = []
-    koji_channels = session.listChannels()
+    return list(iter_channels(ctx))
 
-    for koji_channel in koji_channels:
-        channel_objects.append(Channel(koji_channel["name"], koji_channel["id"]))
 
-    return channel_objects
+def iter_channels(ctx):
+    """
+    Generator yielding a channel object for each koji channel as
+    listChannels returns them
+    """
+    for koji_channel in ctx.session.listChannels():
+        yield Channel(koji_channel["name"], koji_channel["id"])
+
+
+def collect_hub(ctx):
+    """
+    Collects every koji channel and its hosts. A host that belongs to several
+    channels is represented by a single Host object shared by the channels.
+
+    returns a list of channel objects and a list of the distinct hosts
+    """
+    channels = collect_channels(ctx)
+    known_hosts = {}
+    for channel in channels:
+        channel.collect_hosts(ctx, known_hosts)
+
+    return channels, list(known_hosts.values())
+
+
+def host_row(host):
+    """
+    Returns the listHosts fields of a host as a tuple, for sending the host
+    to a shard worker
+    """
+    return (host.name, host.id, host.enabled, " ".join(host.hw.arches), host.desc_str)
+
+
+def host_result(host):
+    """
+    Returns the probe results of a host as a compact tuple of its id, its
+    builds' tasks, its HwInfo fields, what its sampled builds disagree on
+    and whether a hw_info.log was read, for sending back from a shard worker
+    """
+    return (
+        host.id,
+        tuple((task.task_id, task.parent_id, task.build_id) for task in host.task_list),
+        tuple(getattr(host.hw, field) for field in HwInfo.__slots__),
+        host.disagreement,
+        host.hw_log_read,
+    )
+
+
+def load_host_result(host, result):
+    """
+    Loads a result made by host_result into host
+    """
+    host_id, tasks, fields, host.disagreement, host.hw_log_read = result
+    host.task_list.extend(Task(*task) for task in tasks)
+    host.hw.update(dict(zip(HwInfo.__slots__, fields)))
+
+
+def host_from_record(record):
+    """
+    Returns a Host made from a host record written by ShardReport
+    """
+    host = Host(
+        record["name"], record["id"], record["enabled"], " ".join(record["arches"]), None
+    )
+    if record["build_id"] != None:
+        host.task_list.append(
+            Task(record["task_id"], record["parent_id"], record["build_id"])
+        )
+    host.hw.update({field: record[field] for field in HwInfo.__slots__})
+    host.disagreement = record.get("disagreement")
+    return host
+
+
+def context_from_args(args):
+    """
+    Returns the run context for the command line arguments of a check
+    """
+    cache = None
+    if args.cache or args.incremental:
+        cache = HwInfoCache(ttl=args.cache_ttl)
+    http = LogSession(
+        pool_size=max(args.http_pool, args.jobs),
+        timeout=args.http_timeout,
+        retries=args.http_retries,
+        rate=args.http_rate,
+    )
+    hub_throttle = Throttle(
+        "hub", rate=args.hub_rate, concurrency=args.jobs, retries=args.hub_retries
+    )
+    return RunContext(
+        profile=args.profile,
+        server=args.server,
+        topurl=args.topurl,
+        http=http,
+        cache=cache,
+        jobs=args.jobs,
+        search_limit=args.scratch_limit,
+        hub_throttle=hub_throttle,
+    )
+
+
+def select_probe(args):
+    """
+    Returns the probe function for the command line arguments of a check
+    """
+    if args.samples > 1:
+        probe = functools.partial(probe_hosts_sampled, samples=args.samples)
+        if args.incremental:
+            return functools.partial(probe_hosts_incremental, probe=probe)
+        return probe
+    if args.incremental:
+        return probe_hosts_incremental
+    elif args.batch:
+        return probe_hosts_batched
+    return probe_hosts
+
+
+# Run context and probe function of a shard worker process
+WORKER = {}
+
+
+def init_shard_worker(args):
+    """
+    Sets up a shard worker process with a run context, and so a hub session,
+    of its own
+    """
+    WORKER["ctx"] = context_from_args(args)
+    WORKER["probe"] = select_probe(args)
+
+
+def probe_shard(rows):
+    """
+    Probes the hosts given as host_row tuples in a shard worker process
+
+    returns a host_result tuple for each host
+    """
+    hosts = [Host(*row) for row in rows]
+    WORKER["probe"](hosts, WORKER["ctx"])
+    return [host_result(host) for host in hosts]
+
+
+def probe_hosts_sharded(hosts, ctx, on_probed=None, executor=None, shards=1):
+    """
+    Probes hosts in the worker processes of executor, a ProcessPoolExecutor
+    set up with init_shard_worker. hosts are split in four chunks per worker
+    to balance the load, and only their listHosts fields are sent to the
+    workers and compact results sent back. If on_probed is given it is
+    called with each host, in order, as soon as its chunk is done.
+
+    returns the probed hosts in the same order they were given
+    """
+    hosts = list(hosts)
+    by_id = {host.id: host for host in hosts}
+    size = max(-(-len(hosts) // (shards * 4)), 1)
+    futures = [
+        executor.submit(probe_shard, [host_row(host) for host in hosts[i : i + size]])
+        for i in range(0, len(hosts), size)
+    ]
+    for future in futures:
+        for result in future.result():
+            host = by_id[result[0]]
+            load_host_result(host, result)
+            if on_probed != None:
+                on_probed(host)
+    return hosts
 
 
 def check(args):
@@ -307,37 +1488,169 @@ def check(args):
             level=logging.INFO,
             datefmt="%Y-%m-%d %H:%M:%S",
         )
-    channel_name = args.channel
+    TIMINGS.enabled = args.timings or args.timings_json != None
 
-    mykoji = koji.get_profile_module("brew")
+    ctx = context_from_args(args)
 
-    opts = vars(mykoji.config)
-    session = mykoji.ClientSession(mykoji.config.server, opts)
+    if args.all_channels:
+        channels = iter_channels(ctx)
+    else:
+        channel_info = ctx.session.getChannel(args.channel)
+        channels = [Channel(channel_info["name"], channel_info["id"])]
 
-    channel_info = session.getChannel(channel_name)
-    mychannel = Channel(channel_info["name"], channel_info["id"])
-    mychannel.collect_hosts(session)
+    # The output of a cached run is recorded for identical runs to reuse
+    key = result_key(args)
+    out = RecordedOutput(sys.stdout) if key != None else sys.stdout
+    if args.shard != None:
+        report = ShardReport(args.shard)
+    else:
+        report = REPORTS[args.format](out)
 
-    for hosts in mychannel.host_list:
-        hosts.find_builds_for_host(session)
-        hosts.get_hw_info(session)
+    probe = select_probe(args)
+    executor = None
+    if args.processes > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=args.processes,
+            initializer=init_shard_worker,
+            initargs=(args,),
+        )
+        probe = functools.partial(
+            probe_hosts_sharded, executor=executor, shards=args.processes
+        )
 
-    mychannel.config_check()
+    # A shard only has some of each channel's hosts, so it records no history
+    history = None
+    if args.history and args.shard == None:
+        history = HistoryStore(args.history_file)
+        run_id, run_ts = history.start_run()
 
-    print(f"{mychannel.name} contains {len(mychannel.host_list)} hosts")
-    print(
-        f"{mychannel.name} was divided in to {len(mychannel.config_groups)} configuration groups based on CPU count and Ram"
-    )
-    for index, sub_list in enumerate(mychannel.config_groups):
+    # Hosts stream from listHosts into the probes and each channel is grouped
+    # as its hosts are probed, then reported as soon as it is done
+    known_hosts = {}
+    validity = []
+    for channel in channels:
+        if args.thresholds != None:
+            channel.set_thresholds(args.thresholds.for_channel(channel.name))
+
+        # Hosts are collected as the probe reads them, so the time spent
+        # collecting is added up as they stream in
+        new_hosts = TIMINGS.timed_iter(
+            "collect_hosts", channel.iter_hosts(ctx, known_hosts)
+        )
+        if args.shard != None:
+            index, count = args.shard
+            new_hosts = (host for host in new_hosts if host.id % count == index)
+
+        # Probes finish hosts out of order, and hosts shared with an earlier
+        # channel are not probed again, so the grouper adds hosts in
+        # host_list order as those before them are done
+        grouper = OrderedHostGrouper(channel.host_list, channel.thresholds.tolerance)
+        new_hosts = grouper.hold(new_hosts)
+
+        def on_probed(host):
+            report.host(host)
+            with TIMINGS.timed("config_check"):
+                grouper.ready(host)
+
+        with TIMINGS.timed("probe"):
+            if args.tiered:
+                probe_hosts_tiered(
+                    new_hosts,
+                    ctx,
+                    on_probed=on_probed,
+                    probe=probe,
+                    max_age=args.description_max_age,
+                )
+            else:
+                probe(new_hosts, ctx, on_probed=on_probed)
+
+        # A shard only has some of the channel's hosts, so it is grouped and
+        # validated once the shards are merged
+        if args.shard != None:
+            report.channel(channel, None)
+            continue
+
+        with TIMINGS.timed("config_check"):
+            channel.config_groups = grouper.finish()
+
+        valid = channel.is_valid()
+        report.channel(channel, valid)
+        validity.append((channel, valid))
+        if history != None:
+            history.record_channel(run_id, run_ts, channel, valid)
+
+    if executor != None:
+        executor.shutdown()
+    if history != None:
+        history.close()
+    report.finish(validity)
+
+    status = 0 if all(valid for channel, valid in validity) else 1
+    if key != None:
+        ctx.cache.put_result(key, out.getvalue(), status)
+    ctx.close()
+
+    if args.timings:
+        print(TIMINGS.format_summary(), file=sys.stderr)
+    if args.timings_json != None:
+        TIMINGS.write_json(args.timings_json)
+
+    return status
+
+
+def merge(args):
+    """
+    Merges the JSON documents written by the shards of a run split with
+    --shard, then groups, validates and reports every channel
+    """
+    documents = []
+    for path in args.files:
+        with open(path) as fp:
+            documents.append(json.load(fp))
+
+    shards = sorted(tuple(document["shard"]) for document in documents)
+    count = shards[0][1]
+    if shards != [(index, count) for index in range(count)]:
         print(
-            f"\n================================ Group {index+1}/{len(mychannel.config_groups)} ================================"
+            f"Expected one document for each of {count} shards, got shards {shards}",
+            file=sys.stderr,
         )
-        for hosts in sub_list:
-            print(
-                f"ID: {hosts.id} arches: {hosts.hw_dict['arches']} CPU(s): {hosts.hw_dict['CPU(s)']} Ram: {hosts.hw_dict['Ram']} Disk: {hosts.hw_dict['Disk']} Kernel: {hosts.hw_dict['Kernel']} O/S: {hosts.hw_dict['Operating System']}"
-            )
+        return 2
+
+    hosts = {}
+    for document in documents:
+        for record in document["hosts"]:
+            hosts[record["id"]] = host_from_record(record)
+
+    report = REPORTS[args.format]()
+    for host in hosts.values():
+        report.host(host)
+
+    history = None
+    if args.history:
+        history = HistoryStore(args.history_file)
+        run_id, run_ts = history.start_run()
+
+    validity = []
+    for record in documents[0]["channels"]:
+        channel = Channel(record["channel"], record["id"], record["min_cpus"])
+        if args.thresholds != None:
+            channel.set_thresholds(args.thresholds.for_channel(channel.name))
+        channel.host_list = [
+            hosts.get(host_id) or Host("unknown", host_id, False, "", None)
+            for host_id in record["hosts"]
+        ]
+        channel.config_check()
+        valid = channel.is_valid()
+        report.channel(channel, valid)
+        validity.append((channel, valid))
+        if history != None:
+            history.record_channel(run_id, run_ts, channel, valid)
+    if history != None:
+        history.close()
+    report.finish(validity)
 
-    if mychannel.is_valid():
+    if all(valid for channel, valid in validity):
         return 0
 
     return 1
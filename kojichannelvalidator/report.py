@@ -0,0 +1,210 @@
+import json
+import sys
+
+
+def host_record(host):
+    """
+    Returns a JSON serializable dict describing a probed host
+    """
+    hw = host.hw
+    record = {
+        "id": host.id,
+        "name": host.name,
+        "enabled": host.enabled,
+        "build_id": host.task_list[0].build_id if len(host.task_list) != 0 else None,
+        "arches": hw.arches,
+        "cpus": hw.cpus,
+        "ram_kb": hw.ram_kb,
+        "disk": hw.disk,
+        "kernel": hw.kernel,
+        "os": hw.os,
+        "model_name": hw.model_name,
+        "sockets": hw.sockets,
+        "threads_per_core": hw.threads_per_core,
+        "swap_kb": hw.swap_kb,
+        "mount": hw.mount,
+    }
+    # Only hosts probed from several builds have a disagreement
+    if host.disagreement != None:
+        record["disagreement"] = host.disagreement
+    return record
+
+
+def group_record(channel, index, group):
+    """
+    Returns a JSON serializable dict describing a configuration group. The
+    CPU(s) and Ram of a group are those of its first host.
+    """
+    return {
+        "channel": channel.name,
+        "group": index + 1,
+        "cpus": group[0].hw.cpus,
+        "ram_kb": group[0].hw.ram_kb,
+        "hosts": [host.id for host in group],
+    }
+
+
+def channel_record(channel, valid):
+    """
+    Returns a JSON serializable dict summarizing a validated channel
+    """
+    return {
+        "channel": channel.name,
+        "id": channel.id,
+        "hosts": len(channel.host_list),
+        "groups": len(channel.config_groups),
+        "min_cpus": channel.min_cpus,
+        "valid": valid,
+    }
+
+
+class RecordedOutput:
+    """
+    Writes to out while keeping a copy of everything written, so a report
+    can be streamed and stored once it is finished
+    """
+
+    def __init__(self, out):
+        self.out = out
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+        return self.out.write(text)
+
+    def flush(self):
+        self.out.flush()
+
+    def getvalue(self):
+        return "".join(self.parts)
+
+
+class TextReport:
+    """
+    Human readable report of each channel's configuration groups
+    """
+
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+
+    def write(self, line=""):
+        self.out.write(f"{line}\n")
+
+    def host(self, host):
+        """
+        Called as soon as a host has been probed
+        """
+
+    def channel(self, channel, valid):
+        """
+        Called once a channel has been grouped and validated
+        """
+        self.write(f"{channel.name} contains {len(channel.host_list)} hosts")
+        self.write(
+            f"{channel.name} was divided in to {len(channel.config_groups)} configuration groups based on CPU count and Ram"
+        )
+        for index, sub_list in enumerate(channel.config_groups):
+            self.write(
+                f"\n================================ Group {index+1}/{len(channel.config_groups)} ================================"
+            )
+            for hosts in sub_list:
+                line = f"ID: {hosts.id} arches: {hosts.hw.arches} CPU(s): {hosts.hw.cpus} Ram: {hosts.hw.ram_kb} Disk: {hosts.hw.disk} Kernel: {hosts.hw.kernel} O/S: {hosts.hw.os}"
+                if hosts.disagreement:
+                    line += f" Samples disagree: {hosts.disagreement}"
+                self.write(line)
+
+    def finish(self, validity):
+        """
+        Called at the end of the run with a list of (channel, valid) pairs
+        """
+        if len(validity) > 1:
+            self.write(
+                "\n================================ Summary ================================"
+            )
+            for channel, valid in validity:
+                self.write(f"{channel.name}: {'valid' if valid else 'INVALID'}")
+
+
+class NdjsonReport(TextReport):
+    """
+    Newline delimited JSON report. A host record is written as soon as each
+    host is probed, followed by group and channel records once each channel
+    is validated.
+    """
+
+    def write_record(self, record_type, record):
+        self.out.write(json.dumps({"type": record_type, **record}) + "\n")
+        self.out.flush()
+
+    def host(self, host):
+        self.write_record("host", host_record(host))
+
+    def channel(self, channel, valid):
+        for index, group in enumerate(channel.config_groups):
+            self.write_record("group", group_record(channel, index, group))
+        self.write_record("channel", channel_record(channel, valid))
+
+    def finish(self, validity):
+        pass
+
+
+class JsonReport(TextReport):
+    """
+    Single JSON document written at the end of the run
+    """
+
+    def __init__(self, out=None):
+        super().__init__(out)
+        self.channels = []
+
+    def channel(self, channel, valid):
+        record = channel_record(channel, valid)
+        record["config_groups"] = [
+            [host_record(host) for host in group] for group in channel.config_groups
+        ]
+        self.channels.append(record)
+
+    def finish(self, validity):
+        json.dump({"channels": self.channels}, self.out, indent=2)
+        self.out.write("\n")
+
+
+class ShardReport(TextReport):
+    """
+    JSON document for one shard of a run split with --shard, holding the
+    records of the hosts probed by the shard and the host ids of every
+    channel, for merging with the documents of the other shards
+    """
+
+    def __init__(self, shard, out=None):
+        super().__init__(out)
+        self.shard = shard
+        self.hosts = []
+        self.channels = []
+
+    def host(self, host):
+        record = host_record(host)
+        task = host.task_list[0] if len(host.task_list) != 0 else None
+        record["task_id"] = task.task_id if task != None else None
+        record["parent_id"] = task.parent_id if task != None else None
+        self.hosts.append(record)
+
+    def channel(self, channel, valid):
+        self.channels.append(
+            {
+                "channel": channel.name,
+                "id": channel.id,
+                "min_cpus": channel.min_cpus,
+                "hosts": [host.id for host in channel.host_list],
+            }
+        )
+
+    def finish(self, validity):
+        json.dump(
+            {"shard": list(self.shard), "channels": self.channels, "hosts": self.hosts},
+            self.out,
+        )
+        self.out.write("\n")
+
+
+REPORTS = {"text": TextReport, "json": JsonReport, "ndjson": NdjsonReport}
@@ -0,0 +1,13 @@
+import pytest
+import requests
+from kojichannelvalidator.tests.util import FakeResponse
+
+
+@pytest.fixture
+def fake_request(monkeypatch):
+    """Fake for requests.Session.get()"""
+
+    def fake_get(self, url, **kwargs):
+        return FakeResponse(url)
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
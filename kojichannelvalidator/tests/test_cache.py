@@ -0,0 +1,90 @@
+import sqlite3
+import time
+import pytest
+from kojichannelvalidator.cache import HW_FIELDS, HwInfoCache
+from kojichannelvalidator.hw_log import empty_hw_log
+
+HW_INFO = {
+    "cpus": 8,
+    "sockets": 1,
+    "threads_per_core": 1,
+    "model_name": "POWER8 (architected), altivec supported",
+    "ram_kb": 24050560,
+    "swap_kb": 15744960,
+    "disk": "198G",
+    "mount": "/",
+}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = HwInfoCache(path=str(tmp_path / "cache.sqlite"), max_entries=2)
+    yield cache
+    cache.close()
+
+
+def test_hw_info_round_trip(cache):
+    """
+    Tests that parsed hw info is stored and loaded by build id and log dir
+    """
+    cache.put_hw_info(1757570, "ppc64le", HW_INFO)
+
+    assert cache.get_hw_info(1757570, "ppc64le") == HW_INFO
+    assert cache.get_hw_info(1757570, "x86_64") is None
+
+
+def test_host_build_ttl(cache):
+    """
+    Tests that host entries older than the ttl are not returned
+    """
+    cache.put_host_build(94, 40263182, 40263155, 1757570, "ppc64le")
+    assert cache.get_host_build(94)["build_id"] == 1757570
+
+    cache.ttl = 0
+    time.sleep(0.01)
+    assert cache.get_host_build(94) is None
+
+
+def test_max_entries_eviction(cache):
+    """
+    Tests that the least recently used hw info entry is evicted
+    """
+    cache.put_hw_info(1, "x86_64", HW_INFO)
+    time.sleep(0.01)
+    cache.put_hw_info(2, "x86_64", HW_INFO)
+    time.sleep(0.01)
+    cache.get_hw_info(1, "x86_64")
+    time.sleep(0.01)
+    cache.put_hw_info(3, "x86_64", HW_INFO)
+
+    assert cache.get_hw_info(2, "x86_64") is None
+    assert cache.get_hw_info(1, "x86_64") == HW_INFO
+    assert cache.get_hw_info(3, "x86_64") == HW_INFO
+
+
+def test_schema_upgrade(tmp_path):
+    """
+    Tests that every field parsed from hw_info.log is cached, and that the
+    entries of a cache written before swap was stored are dropped
+    """
+    assert set(HW_FIELDS) == set(empty_hw_log())
+
+    path = str(tmp_path / "old.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE hw_info (build_id INTEGER, log_dir TEXT, cpus INTEGER, "
+        "ram INTEGER, disk TEXT, created REAL, used REAL, "
+        "PRIMARY KEY (build_id, log_dir))"
+    )
+    conn.execute(
+        "INSERT INTO hw_info VALUES (1, 'x86_64', 8, 24050560, '198G', ?, ?)",
+        (time.time(), time.time()),
+    )
+    conn.commit()
+    conn.close()
+
+    cache = HwInfoCache(path=path)
+    assert cache.get_hw_info(1, "x86_64") is None
+    cache.put_hw_info(1, "x86_64", HW_INFO)
+    assert cache.get_hw_info(1, "x86_64") == HW_INFO
+    cache.close()
@@ -1,31 +1,31 @@
+import contextlib
+import datetime
+import io
+import json
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
 import pytest
 import requests
 import yaml
 import kojichannelvalidator.koji_channel_validator as cv
-from kojichannelvalidator.tests.util import FakeCall
+from kojichannelvalidator import grouping
+from kojichannelvalidator.__main__ import build_merge_parser, build_parser
+from kojichannelvalidator.tests.util import FakeSession
+from kojichannelvalidator.tests.util import FakeMultiCall
+from kojichannelvalidator.tests.util import FakeVirtualCall
 from kojichannelvalidator.tests.util import FakeResponse
-
-
-@pytest.fixture
-def fake_request(monkeypatch):
-    """Fake for requests.get()"""
-
-    def fake_get(url):
-        return FakeResponse(url)
-
-    monkeypatch.setattr(requests, "get", fake_get)
-
-
-class FakeSession:
-    def __getattr__(self, name):
-        return FakeCall(name)
+from kojichannelvalidator.tests.util import fake_context
+from kojichannelvalidator.tests.util import TOPURL
+from kojichannelvalidator.cache import HwInfoCache
 
 
 def test_collect_channels():
     """
     Tests for functioning of collect_channels function
     """
-    channel_list = cv.collect_channels(FakeSession())
+    channel_list = cv.collect_channels(fake_context())
 
     assert len(channel_list) == 37
 
@@ -43,7 +43,7 @@ def test_get_hw_info(test_host_with_build, fake_request):
         "Operating System": "RedHat 8.2",
     }
     my_host = test_host_with_build
-    my_host.get_hw_info(FakeSession())
+    my_host.get_hw_info(fake_context())
 
     assert my_host.hw_dict == expected
 
@@ -95,35 +95,7 @@ def test_host_with_build(host_94_list_host):
     test_task = cv.Task(
         task_id=40263182,
         parent_id=40263155,
-        build_info={
-            "build_id": 1757570,
-            "completion_time": "2021-10-11 18:33:52.018836",
-            "completion_ts": 1633977232.01884,
-            "creation_event_id": 41464043,
-            "creation_time": "2021-10-11 18:30:42.450638",
-            "creation_ts": 1633977042.45064,
-            "epoch": None,
-            "extra": {
-                "source": {
-                    "original_url": "git://pkgs.devel.redhat.com/rpms/e2e-module-test?#0fb8c7868015e81b4ef62168cb0a71ce70f7dd2b"
-                }
-            },
-            "name": "e2e-module-test",
-            "nvr": "e2e-module-test-1.0.4127-1.module+e2e+12941+acfc830c",
-            "owner_id": 4066,
-            "owner_name": "mbs",
-            "package_id": 71581,
-            "package_name": "e2e-module-test",
-            "release": "1.module+e2e+12941+acfc830c",
-            "source": "git://pkgs.devel.redhat.com/rpms/e2e-module-test#0fb8c7868015e81b4ef62168cb0a71ce70f7dd2b",
-            "start_time": "2021-10-11 18:30:42.443708",
-            "start_ts": 1633977042.44371,
-            "state": 1,
-            "task_id": 40263155,
-            "version": "1.0.4127",
-            "volume_id": 9,
-            "volume_name": "rhel-8",
-        },
+        build_id=1757570,
     )
     test_host = cv.Host(
         "rhel8", 94, True, host_94_list_host["arches"], host_94_list_host["description"]
@@ -154,3 +126,673 @@ def host_94_list_host():
         "task_load": 0.4,
         "user_id": 1744,
     }
+
+
+def test_probe_hosts_keeps_order(monkeypatch):
+    """
+    Tests that probe_hosts returns hosts in input order and creates no more
+    sessions than worker threads
+    """
+    sessions = []
+
+    def session_factory():
+        sessions.append(object())
+        return sessions[-1]
+
+    def fake_probe_host(host, session, *args):
+        host.hw_dict["CPU(s)"] = host.id
+        return host
+
+    monkeypatch.setattr(cv, "probe_host", fake_probe_host)
+    hosts = [cv.Host(f"host-{i}", i, True, "x86_64", None) for i in range(20)]
+
+    probed = cv.probe_hosts(
+        hosts, fake_context(session_factory=session_factory, jobs=4)
+    )
+
+    assert [host.id for host in probed] == list(range(20))
+    assert all(host.hw_dict["CPU(s)"] == host.id for host in probed)
+    assert 1 <= len(sessions) <= 4
+
+
+def test_probe_hosts_stops_workers_on_error(monkeypatch):
+    """
+    Tests that the worker threads of probe_hosts are shut down when on_probed
+    raises
+    """
+
+    def fake_probe_host(host, ctx, session):
+        return host
+
+    def on_probed(host):
+        raise RuntimeError("report failed")
+
+    monkeypatch.setattr(cv, "probe_host", fake_probe_host)
+    hosts = [cv.Host(f"host-{i}", i, True, "x86_64", None) for i in range(20)]
+    before = threading.active_count()
+
+    with pytest.raises(RuntimeError):
+        cv.probe_hosts(hosts, fake_context(jobs=4), on_probed=on_probed)
+
+    assert threading.active_count() == before
+
+
+def test_jobs_must_be_positive():
+    """
+    Tests that -j only accepts a positive number of jobs
+    """
+    assert build_parser().parse_args(["-c", "dummy-rhel8", "-j", "4"]).jobs == 4
+    for jobs in ["0", "-2", "four"]:
+        with pytest.raises(SystemExit):
+            build_parser().parse_args(["-c", "dummy-rhel8", "-j", jobs])
+
+
+def test_probe_hosts_batched(fake_request):
+    """
+    Tests that probe_hosts_batched collects hw info for a channel using three
+    multicalls
+    """
+    ctx = fake_context(jobs=4)
+    channel = cv.Channel(name="dummy-rhel8", id=21)
+    channel.collect_hosts(ctx)
+
+    cv.probe_hosts_batched(channel.host_list, ctx)
+
+    host_94 = [host for host in channel.host_list if host.id == 94][0]
+    assert ctx.session.multicalls == 3
+    assert all(len(host.task_list) == 1 for host in channel.host_list)
+    assert host_94.hw_dict["CPU(s)"] == 8
+    assert host_94.hw_dict["Ram"] == 24050560
+    assert host_94.hw_dict["Disk"] == "198G"
+
+
+def test_probe_host_warm_cache(tmp_path, fake_request, monkeypatch):
+    """
+    Tests that a host with a cached build is not probed again
+    """
+    ctx = fake_context(cache=HwInfoCache(path=str(tmp_path / "cache.sqlite")))
+    first = cv.Host("rhel8", 94, True, "ppc ppc64le", None)
+    cv.probe_host(first, ctx)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("warm cache should not hit the network")
+
+    monkeypatch.setattr(requests.Session, "get", fail)
+    monkeypatch.setattr(FakeSession, "__getattr__", lambda self, name: fail)
+    second = cv.Host("rhel8", 94, True, "ppc ppc64le", None)
+    cv.probe_host(second, ctx)
+    ctx.close()
+
+    assert second.hw_dict["CPU(s)"] == 8
+    assert second.hw_dict["Ram"] == 24050560
+    assert second.task_list[0].build_id == 1757570
+
+
+def test_run_context_loads_profile_once(monkeypatch, fake_request):
+    """
+    Tests that the koji profile is loaded once per run, not once per host,
+    and that --topurl overrides the profile's download server
+    """
+    loaded = []
+
+    def get_profile_module(name):
+        loaded.append(name)
+        return SimpleNamespace(
+            config=SimpleNamespace(server="http://hub", topurl="http://wrong"),
+            ClientSession=lambda server, opts: FakeSession(),
+        )
+
+    monkeypatch.setattr(cv.koji, "get_profile_module", get_profile_module)
+    ctx = cv.RunContext(profile="stage", topurl=TOPURL)
+    channel = cv.Channel(name="dummy-rhel8", id=21)
+    channel.collect_hosts(ctx)
+    cv.probe_hosts_batched(channel.host_list, ctx)
+
+    assert loaded == ["stage"]
+    assert ctx.server == "http://hub"
+    host_94 = [host for host in channel.host_list if host.id == 94][0]
+    assert host_94.hw_dict["CPU(s)"] == 8
+
+
+def test_collect_hub_shares_hosts():
+    """
+    Tests that collect_hub creates one Host object per host across channels
+    """
+    channels, hosts = cv.collect_hub(fake_context())
+
+    assert len(channels) == 37
+    assert len(hosts) == 15
+    assert all(channel.host_list[0] is hosts[0] for channel in channels)
+
+
+def test_read_hw_log_stops_after_storage(test_host_with_build):
+    """
+    Tests that read_hw_log stops streaming once the Storage section is parsed
+    and closes the response
+    """
+    url = "http://download.devel.redhat.com/brewroot/vol/rhel-8/packages/e2e-module-test/1.0.4127/1.module+e2e+12941+acfc830c/data/logs/ppc64le/hw_info.log"
+    response = FakeResponse(url)
+    response.text += "\ntrailing: 1\n/dev/sdb  1T\n"
+
+    class FakeHttp(cv.LogSession):
+        def get(self, url, **kwargs):
+            return response
+
+    test_host_with_build.read_hw_log(
+        fake_context(http=FakeHttp()),
+        {"dir": "ppc64le", "path": url.split("brewroot/")[1]},
+    )
+
+    assert test_host_with_build.hw_dict["Disk"] == "198G"
+    assert response.closed
+
+
+def pairwise_groups(hosts):
+    """
+    Reference grouping that compares every pair of hosts with compare_hosts
+    """
+    groups = []
+    grouped = set()
+    for i in range(len(hosts)):
+        if hosts[i] in grouped:
+            continue
+        group = [hosts[i]]
+        grouped.add(hosts[i])
+        for j in range(i + 1, len(hosts)):
+            if hosts[j] not in grouped and cv.compare_hosts(hosts[i], hosts[j]):
+                group.append(hosts[j])
+                grouped.add(hosts[j])
+        groups.append(group)
+    return groups
+
+
+def incremental_groups(hosts):
+    """
+    Groups hosts by adding them to a HostGrouper one at a time
+    """
+    grouper = grouping.HostGrouper()
+    for host in hosts:
+        grouper.add(host)
+    return grouper.groups
+
+
+def test_group_hosts_matches_pairwise(test_channel_with_hosts):
+    """
+    Tests that group_hosts gives the same groups as the pairwise comparison
+    on the fixture hosts and on randomly generated hosts
+    """
+    random.seed(1234)
+    hosts = test_channel_with_hosts.host_list
+    assert cv.group_hosts(hosts) == pairwise_groups(hosts)
+    assert incremental_groups(hosts) == pairwise_groups(hosts)
+
+    for trial in range(50):
+        hosts = []
+        for i in range(60):
+            host = cv.Host(f"host-{i}", i, True, "x86_64", None)
+            host.hw_dict["CPU(s)"] = random.choice([4, 8, 16, None])
+            host.hw_dict["Ram"] = random.choice(
+                [None, random.randrange(0, 20000000, 500000)]
+            )
+            hosts.append(host)
+        assert cv.group_hosts(hosts) == pairwise_groups(hosts)
+        assert incremental_groups(hosts) == pairwise_groups(hosts)
+
+
+def test_host_hw_fields_are_typed():
+    """
+    Tests that CPU(s) and Ram are stored as int or None whatever their source
+    """
+    host = cv.Host("rhel8", 94, True, "x86_64", "CPU(s): 8\nRam: unknown\n")
+
+    assert host.hw.cpus == 8
+    assert host.hw.ram_kb is None
+
+    host.hw_dict["Ram"] = "24050560"
+    assert host.hw.ram_kb == 24050560
+    assert not hasattr(host, "__dict__")
+
+
+def test_probe_hosts_incremental(tmp_path, fake_request):
+    """
+    Tests that an incremental run only probes hosts whose newest task changed
+    """
+    cache = HwInfoCache(path=str(tmp_path / "cache.sqlite"))
+    ctx = fake_context(cache=cache)
+    channel = cv.Channel(name="dummy-rhel8", id=21)
+    channel.collect_hosts(ctx)
+    cv.probe_hosts_incremental(channel.host_list, ctx)
+    assert ctx.session.multicalls == 4
+
+    probed = []
+
+    def probe(hosts, ctx, on_probed=None):
+        probed.extend(host.id for host in hosts)
+        cv.probe_hosts_batched(hosts, ctx, on_probed=on_probed, from_cache=False)
+
+    ctx = fake_context(cache=cache)
+    rerun = cv.Channel(name="dummy-rhel8", id=21)
+    rerun.collect_hosts(ctx)
+    cv.probe_hosts_incremental(rerun.host_list, ctx, probe=probe)
+    cache.close()
+
+    # Hosts 182 and 183 have no hw_info.log for their arches, so they have
+    # no snapshot and are probed again
+    assert probed == [182, 183]
+    assert [host.hw_dict for host in rerun.host_list] == [
+        host.hw_dict for host in channel.host_list
+    ]
+    assert [host.task_list[0].build_id for host in rerun.host_list] == [
+        1757570
+    ] * len(rerun.host_list)
+
+
+def test_probe_hosts_incremental_failed_probe(tmp_path, monkeypatch, fake_request):
+    """
+    Tests that a host whose download failed is probed again by the next
+    incremental run
+    """
+    cache = HwInfoCache(path=str(tmp_path / "cache.sqlite"))
+    fake_get = requests.Session.get
+
+    def fail(self, url, **kwargs):
+        raise requests.ConnectionError("download server down")
+
+    monkeypatch.setattr(requests.Session, "get", fail)
+    channel = cv.Channel(name="dummy-rhel8", id=21)
+    ctx = fake_context(cache=cache, http=cv.LogSession(retries=0))
+    channel.collect_hosts(ctx)
+    cv.probe_hosts_incremental(channel.host_list, ctx)
+    assert all(host.hw.cpus == None for host in channel.host_list)
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    expected = cv.Channel(name="dummy-rhel8", id=21)
+    ctx = fake_context()
+    expected.collect_hosts(ctx)
+    cv.probe_hosts_batched(expected.host_list, ctx)
+
+    rerun = cv.Channel(name="dummy-rhel8", id=21)
+    ctx = fake_context(cache=cache)
+    rerun.collect_hosts(ctx)
+    cv.probe_hosts_incremental(rerun.host_list, ctx)
+    cache.close()
+
+    assert [host.hw_dict for host in rerun.host_list] == [
+        host.hw_dict for host in expected.host_list
+    ]
+
+
+def described_hosts(ctx):
+    """
+    Returns the hosts of dummy-rhel8 with a CPU(s) line in their descriptions
+    """
+    return [
+        cv.Host(
+            row["name"],
+            row["id"],
+            row["enabled"],
+            row["arches"],
+            row["description"] + "CPU(s): 8\n",
+        )
+        for row in ctx.session.listHosts(channelID=21)
+    ]
+
+
+def test_probe_hosts_incremental_described_failed_probe(tmp_path, monkeypatch, fake_request):
+    """
+    Tests that a host whose CPU(s) are in its description but whose download
+    failed gets no snapshot, and that a hw_info.log without a CPU(s) line is
+    not cached with the description's CPU(s)
+    """
+    cache = HwInfoCache(path=str(tmp_path / "cache.sqlite"))
+    fake_get = requests.Session.get
+
+    def fail(self, url, **kwargs):
+        raise requests.ConnectionError("download server down")
+
+    monkeypatch.setattr(requests.Session, "get", fail)
+    ctx = fake_context(cache=cache, http=cv.LogSession(retries=0))
+    hosts = described_hosts(ctx)
+    cv.probe_hosts_incremental(hosts, ctx)
+    assert all(host.hw.cpus == 8 and not host.hw_log_read for host in hosts)
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    probed = []
+
+    def probe(hosts, ctx, on_probed=None):
+        probed.extend(host.id for host in hosts)
+        cv.probe_hosts_batched(hosts, ctx, on_probed=on_probed, from_cache=False)
+
+    ctx = fake_context(cache=cache)
+    hosts = described_hosts(ctx)
+    cv.probe_hosts_incremental(hosts, ctx, probe=probe)
+    assert probed == [host.id for host in hosts]
+
+    parsed = cv.parse_hw_log("")
+    monkeypatch.setattr(cv, "download_hw_log", lambda ctx, hw_log, host_id: parsed)
+    host = described_hosts(ctx)[0]
+    host.task_list.append(cv.Task(1, 2, 3))
+    host.read_hw_log(fake_context(cache=cache), {"dir": "ppc64le", "path": ""})
+
+    assert host.hw.cpus == 8 and host.hw_log_read
+    assert cache.get_hw_info(3, "ppc64le") is None
+    cache.close()
+
+
+class ScratchSession(FakeSession):
+    """
+    Session for a host whose newest tasks are scratch builds. Task ids count
+    down from 100, and only tasks with an id below real_below have a build.
+    """
+
+    def __init__(self, real_below):
+        self.real_below = real_below
+        self.calls = []
+
+    def listTasks(self, opts, queryOpts):
+        self.calls.append(("listTasks", queryOpts["offset"], queryOpts["limit"]))
+        first = 100 - queryOpts["offset"]
+        return [
+            {"id": task_id, "parent": task_id + 1000}
+            for task_id in range(first, max(first - queryOpts["limit"], 0), -1)
+        ]
+
+    def multicall(self, **kwargs):
+        session = self
+
+        class MultiCall(FakeMultiCall):
+            def listBuilds(self, taskID):
+                session.calls.append(("listBuilds", taskID))
+                build = [{"build_id": taskID}] if taskID - 1000 < session.real_below else []
+                return FakeVirtualCall("listBuilds", build)
+
+        return MultiCall(self)
+
+
+def test_find_builds_for_host_pages():
+    """
+    Tests that the scratch build search widens its window and stops at the
+    first task with a real build
+    """
+    session = ScratchSession(real_below=95)
+    host = cv.Host("rhel8", 94, True, "x86_64", None)
+    host.find_builds_for_host(session)
+
+    assert host.task_list[0].task_id == 94
+    assert [call for call in session.calls if call[0] == "listTasks"] == [
+        ("listTasks", 0, 1),
+        ("listTasks", 1, 2),
+        ("listTasks", 3, 4),
+    ]
+
+
+def test_find_builds_for_host_search_limit():
+    """
+    Tests that the scratch build search gives up after search_limit tasks
+    """
+    session = ScratchSession(real_below=0)
+    host = cv.Host("rhel8", 94, True, "x86_64", None)
+    host.find_builds_for_host(session, search_limit=10)
+
+    assert host.task_list == []
+    assert len([call for call in session.calls if call[0] == "listBuilds"]) == 10
+
+
+def test_find_builds_for_host_short_page(caplog):
+    """
+    Tests that a search ending on a short page logs how many tasks it checked
+    """
+    session = ScratchSession(real_below=0)
+    host = cv.Host("rhel8", 94, True, "x86_64", None)
+    with caplog.at_level("INFO"):
+        host.find_builds_for_host(session, search_limit=200)
+
+    assert host.task_list == []
+    assert "No non scratch build in the last 100 tasks on host 94" in caplog.text
+
+
+LOG_DIR = "vol/rhel-8/packages/e2e-module-test/1.0.4127/1.module+e2e+12941+acfc830c/data/logs"
+
+
+class SampledSession(FakeSession):
+    """
+    Session for a host whose newest task is a scratch build, followed by two
+    ppc64le builds and a build that only has an x86_64 hw_info.log
+    """
+
+    multicalls = 0
+
+    def multicall(self, **kwargs):
+        class MultiCall(FakeMultiCall):
+            def listTasks(self, opts, queryOpts):
+                tasks = [
+                    {"id": task_id, "parent": task_id + 1000, "arch": "ppc64le"}
+                    for task_id in range(100, 94, -1)
+                ]
+                return FakeVirtualCall("listTasks", tasks)
+
+            def listBuilds(self, taskID):
+                build = [{"build_id": taskID}] if taskID != 1100 else []
+                return FakeVirtualCall("listBuilds", build)
+
+            def getBuildLogs(self, build_id):
+                arch = "x86_64" if build_id == 1097 else "ppc64le"
+                log = {"dir": arch, "name": "hw_info.log", "path": f"{LOG_DIR}/{arch}/hw_info.log"}
+                return FakeVirtualCall("getBuildLogs", [log])
+
+        return MultiCall(self)
+
+
+def test_probe_hosts_sampled(fake_request):
+    """
+    Tests that the last builds of a host are sampled with three multicalls
+    and that the host gets their consensus along with their disagreement
+    """
+    ctx = fake_context(session_factory=SampledSession, jobs=4)
+    host = cv.Host("rhel8", 94, True, "ppc64le x86_64", None)
+
+    cv.probe_hosts_sampled([host], ctx, samples=3)
+
+    assert ctx.session.multicalls == 3
+    assert [task.build_id for task in host.task_list] == [1099, 1098, 1097]
+    assert [sample.log_dir for sample in host.samples] == ["ppc64le", "ppc64le", "x86_64"]
+    assert host.hw.cpus == 8
+    assert host.hw.ram_kb == 24050560
+    assert host.disagreement == {
+        "cpus": [8, 24],
+        "ram_kb": [24050560, 32624292],
+    }
+
+
+def test_split_described_hosts():
+    """
+    Tests that only hosts with a recent description that agrees with the
+    other hosts of their arches are validated from the description
+    """
+    channel = cv.Channel(name="dummy-rhel8", id=21)
+    channel.collect_hosts(fake_context())
+
+    trusted, probe = cv.split_described_hosts(
+        channel.host_list, max_age=90, today=datetime.date(2021, 7, 1)
+    )
+
+    assert sorted(described.host.id for described in trusted) == [
+        94, 175, 176, 182, 183, 324, 325, 327
+    ]
+    assert sorted(host.id for host in probe) == [143, 181, 224, 228, 229, 326, 328]
+    host_94 = [described for described in trusted if described.host.id == 94][0]
+    assert host_94.hw.cpus == 8
+    assert host_94.hw.ram_kb == cv.to_kb("23.497 gb")
+
+
+def test_probe_hosts_tiered_well_described(fake_request):
+    """
+    Tests that a channel whose descriptions can all be trusted is validated
+    without reading any hw_info.log
+    """
+    probed = []
+    ctx = fake_context()
+    channel = cv.Channel(name="dummy-rhel8", id=21)
+    channel.collect_hosts(ctx)
+    channel.host_list = [host for host in channel.host_list if host.id in (182, 183)]
+
+    cv.probe_hosts_tiered(channel.host_list, ctx, on_probed=probed.append, max_age=None)
+
+    assert [host.id for host in probed] == [182, 183]
+    assert all(host.hw.cpus == 4 and host.task_list == [] for host in probed)
+
+
+def test_probe_hosts_streams_hosts(monkeypatch):
+    """
+    Tests that probe_hosts reads a host generator only a few hosts ahead of
+    the hosts it has finished probing
+    """
+    generated = []
+
+    def hosts():
+        for i in range(50):
+            generated.append(i)
+            yield cv.Host(f"host-{i}", i, True, "x86_64", None)
+
+    def fake_probe_host(host, *args):
+        return host
+
+    def on_probed(host):
+        assert len(generated) <= host.id + 1 + 2 * 4
+
+    monkeypatch.setattr(cv, "probe_host", fake_probe_host)
+    probed = cv.probe_hosts(hosts(), fake_context(jobs=4), on_probed=on_probed)
+
+    assert [host.id for host in probed] == list(range(50))
+
+
+def fake_profile(monkeypatch):
+    """
+    Makes every koji profile point at the fixture hub
+    """
+    profile = SimpleNamespace(
+        config=SimpleNamespace(server="http://hub", topurl=TOPURL),
+        ClientSession=lambda server, opts: FakeSession(),
+    )
+    monkeypatch.setattr(cv.koji, "get_profile_module", lambda name: profile)
+
+
+def run_check(options):
+    """
+    Runs check with the given kcv options and returns its output
+    """
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        cv.check(build_parser().parse_args(options))
+    return out.getvalue()
+
+
+def test_check_groups_in_host_order(monkeypatch, fake_request):
+    """
+    Tests that the groups check reports do not depend on the order hosts are
+    probed in
+    """
+    fake_profile(monkeypatch)
+
+    def fake_probe(order):
+        def probe(hosts, ctx, on_probed=None):
+            hosts = list(hosts)
+            for index, host in enumerate(hosts):
+                host.hw.cpus = 8
+                host.hw.ram_kb = 10000000 + 3500000 * (index % 3)
+            for host in order(hosts):
+                on_probed(host)
+
+        return lambda args: probe
+
+    monkeypatch.setattr(cv, "select_probe", fake_probe(list))
+    output = run_check(["-c", "dummy-rhel8"])
+    monkeypatch.setattr(cv, "select_probe", fake_probe(reversed))
+
+    assert run_check(["-c", "dummy-rhel8"]) == output
+    assert "divided in to 2 configuration groups" in output
+
+
+def test_check_timings_phases(tmp_path, monkeypatch, fake_request):
+    """
+    Tests that check times host collection, probing and grouping
+    """
+    fake_profile(monkeypatch)
+    cv.TIMINGS.reset()
+    path = tmp_path / "timings.json"
+    run_check(["-c", "dummy-rhel8", "--timings-json", str(path)])
+    cv.TIMINGS.enabled = False
+    cv.TIMINGS.reset()
+
+    summary = json.load(open(path))
+    for phase in ("collect_hosts", "probe"):
+        assert summary[phase]["count"] == 1
+    assert summary["config_check"]["count"] == 16
+
+
+@pytest.mark.parametrize("options", [["--cache"], ["-i"]])
+def test_cached_run_keeps_swap(tmp_path, monkeypatch, fake_request, caplog, options):
+    """
+    Tests that hosts loaded from the cache or a snapshot keep their swap, so
+    a swap threshold finds the same hosts on a cached run as on a fresh one
+    """
+    fake_profile(monkeypatch)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    path = tmp_path / "thresholds.json"
+    path.write_text(json.dumps({"min": {"swap_kb": 16000000}}))
+    options = ["-c", "dummy-rhel8", "--thresholds", str(path), "--result-ttl", "0"] + options
+
+    violations = []
+    for run in range(2):
+        caplog.clear()
+        with caplog.at_level("INFO"):
+            run_check(options)
+        violations.append(caplog.text.count("does not meet the minimum Swap"))
+
+    assert violations[0] == 3
+    assert violations[1] == violations[0]
+
+
+def test_merge_shards(tmp_path, monkeypatch, fake_request):
+    """
+    Tests that merging the documents of every shard gives the same report as
+    validating in one run
+    """
+    fake_profile(monkeypatch)
+    paths = []
+    for index in range(3):
+        paths.append(str(tmp_path / f"shard{index}.json"))
+        with open(paths[-1], "w") as fp:
+            fp.write(run_check(["-a", "--shard", f"{index}/3"]))
+
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        cv.merge(build_merge_parser().parse_args(paths + ["-f", "json"]))
+
+    assert json.loads(out.getvalue()) == json.loads(run_check(["-a", "-f", "json"]))
+    assert cv.merge(build_merge_parser().parse_args(paths[:2])) == 2
+
+
+def test_probe_hosts_sharded(monkeypatch, fake_request):
+    """
+    Tests that hosts probed by shard workers come back with their build and
+    hardware, in order
+    """
+    fake_profile(monkeypatch)
+    args = build_parser().parse_args(["-c", "dummy-rhel8", "-b"])
+    ctx = fake_context()
+    channel = cv.Channel(name="dummy-rhel8", id=21)
+    channel.collect_hosts(ctx)
+    probed = []
+
+    with ThreadPoolExecutor(
+        max_workers=2, initializer=cv.init_shard_worker, initargs=(args,)
+    ) as executor:
+        cv.probe_hosts_sharded(
+            channel.host_list, ctx, on_probed=probed.append, executor=executor, shards=2
+        )
+
+    host_94 = [host for host in channel.host_list if host.id == 94][0]
+    assert probed == channel.host_list
+    assert host_94.task_list[0].build_id == 1757570
+    assert host_94.hw.cpus == 8 and host_94.hw.model_name.startswith("POWER8")
@@ -0,0 +1,57 @@
+import threading
+import urllib.request
+from http.server import ThreadingHTTPServer
+from kojichannelvalidator import daemon
+from kojichannelvalidator.cache import HwInfoCache
+from kojichannelvalidator.tests.util import fake_context
+
+
+def make_sweeper(channel_names, interval=60):
+    return daemon.Sweeper(
+        fake_context(cache=HwInfoCache(path=":memory:")), channel_names, interval
+    )
+
+
+def test_sweep_and_metrics(fake_request):
+    """
+    Tests that a sweep stores the channel result and that it is rendered as
+    Prometheus metrics
+    """
+    sweeper = make_sweeper(["dummy-rhel8"])
+    sweeper.sweep("dummy-rhel8")
+    metrics = sweeper.metrics()
+
+    assert 'kcv_channel_hosts{channel="dummy-rhel8"} 15' in metrics
+    assert 'kcv_channel_valid{channel="dummy-rhel8"} 0' in metrics
+    assert (
+        'kcv_host_group{channel="dummy-rhel8",host="ppc-016.build.eng.bos.redhat.com",'
+        'host_id="94",group="1",cpus="8",ram_kb="24050560"} 1'
+    ) in metrics
+    assert "# TYPE kcv_sweep_errors_total counter" in metrics
+
+
+def test_schedule_spreads_channels():
+    """
+    Tests that channel sweeps are spread evenly over the interval
+    """
+    sweeper = make_sweeper(["a", "b", "c", "d"], interval=60)
+
+    assert sweeper.schedule(100) == [(100, "a"), (115, "b"), (130, "c"), (145, "d")]
+
+
+def test_metrics_endpoint(fake_request):
+    """
+    Tests that the metrics are served over HTTP
+    """
+    sweeper = make_sweeper(["dummy-rhel8"])
+    sweeper.sweep("dummy-rhel8")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), daemon.make_handler(sweeper))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            body = response.read().decode()
+    finally:
+        server.shutdown()
+
+    assert 'kcv_channel_groups{channel="dummy-rhel8"}' in body
@@ -0,0 +1,142 @@
+import json
+import random
+import pytest
+import kojichannelvalidator.koji_channel_validator as cv
+from kojichannelvalidator import grouping
+
+
+@pytest.fixture(params=["numpy", "python"])
+def engine(request, monkeypatch):
+    """Runs a test with NumPy, if it is installed, and with the fallback"""
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(grouping, "numpy", None)
+    return request.param
+
+
+def random_hosts(count, seed):
+    random.seed(seed)
+    hosts = []
+    for i in range(count):
+        host = cv.Host(f"host-{i}", i, True, "x86_64", None)
+        host.hw.cpus = random.choice([4, 8, 16, None])
+        host.hw.ram_kb = random.choice([None, random.randrange(0, 20000000, 500000)])
+        host.hw.disk = random.choice([None, "198G", "205G", "581G", "1.2T"])
+        host.hw.swap_kb = random.choice([None, 8392640, 15744960])
+        hosts.append(host)
+    return hosts
+
+
+def added_groups(hosts, tolerance):
+    grouper = grouping.HostGrouper(tolerance)
+    for host in hosts:
+        grouper.add(host)
+    return grouper.groups
+
+
+@pytest.mark.parametrize(
+    "tolerance",
+    [
+        None,
+        {"ram_kb": 1000000, "disk_kb": 10 * 1024**2},
+        {"cpus": 4, "ram_kb": None, "swap_kb": 0},
+    ],
+)
+def test_cluster_hosts(engine, tolerance):
+    """
+    Tests that cluster_hosts gives the same groups as the default grouping
+    and as adding hosts to a HostGrouper one at a time
+    """
+    for trial in range(20):
+        hosts = random_hosts(80, trial)
+        groups = grouping.cluster_hosts(hosts, tolerance)
+        assert groups == added_groups(hosts, tolerance)
+        if tolerance == None:
+            assert groups == cv.group_hosts(hosts)
+
+
+def test_ordered_host_grouper():
+    """
+    Tests that hosts probed in any order, with some shared hosts that are not
+    probed at all, are grouped as cluster_hosts groups them in list order
+    """
+    for trial in range(20):
+        hosts = random_hosts(40, trial)
+        host_list = []
+
+        def list_hosts():
+            # Like Channel.iter_hosts, every fifth host is already known
+            for host in hosts:
+                host_list.append(host)
+                if host.id % 5 != 0:
+                    yield host
+
+        grouper = grouping.OrderedHostGrouper(host_list)
+        probed = list(grouper.hold(list_hosts()))
+        random.shuffle(probed)
+        for host in probed:
+            grouper.ready(host)
+
+        assert grouper.next == len(host_list)
+        assert grouper.finish() == grouping.cluster_hosts(host_list, None)
+
+
+def test_check_limits(engine):
+    """
+    Tests that values outside the minimum and maximum are reported in host
+    order and that unknown values are not
+    """
+    hosts = random_hosts(4, 0)
+    for host, cpus, disk in zip(hosts, [4, 8, 64, None], ["198G", None, "1.2T", "2T"]):
+        host.hw.cpus = cpus
+        host.hw.disk = disk
+
+    failed = grouping.check_limits(
+        hosts, {"cpus": 8}, {"cpus": 32, "disk_kb": 1024**3}
+    )
+
+    assert [(host.id, metric, value, bound) for host, metric, value, bound, limit in failed] == [
+        (0, "cpus", 4, "minimum"),
+        (2, "cpus", 64, "maximum"),
+        (2, "disk_kb", 1.2 * 1024**3, "maximum"),
+        (3, "disk_kb", 2 * 1024**3, "maximum"),
+    ]
+
+
+def test_load_thresholds(tmp_path):
+    """
+    Tests that channel thresholds override the top level ones and that
+    unknown metrics are rejected
+    """
+    path = tmp_path / "thresholds.json"
+    path.write_text(
+        json.dumps(
+            {
+                "tolerance": {"ram_kb": 2000000},
+                "min": {"cpus": 4},
+                "channels": {"rhel8": {"min": {"cpus": 16}, "max": {"ram_kb": 8000000}}},
+            }
+        )
+    )
+    config = grouping.load_thresholds(str(path))
+
+    thresholds = config.for_channel("rhel8")
+    assert thresholds.tolerance["ram_kb"] == 2000000
+    assert thresholds.tolerance["cpus"] == 0
+    assert thresholds.minimum == {"cpus": 16}
+    assert config.for_channel("other").maximum == {}
+
+    channel = cv.Channel("rhel8", 1)
+    channel.set_thresholds(thresholds)
+    host = cv.Host("rhel8", 94, True, "x86_64", None)
+    host.hw.cpus = 16
+    host.hw.ram_kb = 24050560
+    channel.host_list.append(host)
+    channel.config_check()
+    assert channel.min_cpus == 16
+    assert not channel.is_valid()
+
+    path.write_text(json.dumps({"channels": {"rhel8": {"min": {"memory": 1}}}}))
+    with pytest.raises(ValueError, match="unknown metric memory"):
+        grouping.load_thresholds(str(path))
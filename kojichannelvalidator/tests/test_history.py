@@ -0,0 +1,99 @@
+import pytest
+from kojichannelvalidator import daemon
+from kojichannelvalidator import koji_channel_validator as cv
+from kojichannelvalidator.cache import HwInfoCache
+from kojichannelvalidator.history import HistoryStore, format_change
+from kojichannelvalidator.tests.util import fake_context
+
+DAY = 24 * 60 * 60
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(path=str(tmp_path / "history.sqlite"))
+    yield store
+    store.close()
+
+
+def make_channel(name, hosts):
+    """
+    Returns a grouped channel of hosts given as (id, cpus, ram_kb) tuples
+    """
+    channel = cv.Channel(name, 1)
+    for host_id, cpus, ram_kb in hosts:
+        host = cv.Host(f"host-{host_id}", host_id, True, "x86_64", None)
+        host.hw.cpus = cpus
+        host.hw.ram_kb = ram_kb
+        channel.host_list.append(host)
+    channel.config_check()
+    return channel
+
+
+def record(store, ts, channel):
+    run_id, run_ts = store.start_run(ts)
+    store.record_channel(run_id, run_ts, channel, channel.is_valid())
+
+
+def test_changes(store):
+    """
+    Tests that CPU(s) and Ram changes are found by comparing each host with
+    its previous entry in the same channel
+    """
+    record(store, 1 * DAY, make_channel("rhel8", [(1, 8, 24050560), (2, 8, 24050560)]))
+    record(store, 10 * DAY, make_channel("rhel8", [(1, 4, 24050560), (2, 8, 24050560)]))
+    record(store, 20 * DAY, make_channel("rhel8", [(1, 4, 24050560), (2, 8, 16000000)]))
+
+    changes = store.changes(5 * DAY)
+
+    assert [(c["host_id"], c["ts"]) for c in changes] == [(1, 10 * DAY), (2, 20 * DAY)]
+    assert changes[0]["cpus_before"] == 8 and changes[0]["cpus"] == 4
+    assert changes[1]["ram_kb_before"] == 24050560 and changes[1]["ram_kb"] == 16000000
+    assert "CPU(s) 8 -> 4" in format_change(changes[0])
+    assert store.changes(15 * DAY, host_id=1) == []
+
+
+def test_changes_filters(store):
+    """
+    Tests that Ram changes within the tolerance and hosts in other channels
+    are not reported
+    """
+    record(store, 1 * DAY, make_channel("rhel8", [(1, 8, 24050560)]))
+    record(store, 1 * DAY, make_channel("rhel9", [(1, 8, 24050560)]))
+    record(store, 2 * DAY, make_channel("rhel8", [(1, 8, 24050000)]))
+    record(store, 2 * DAY, make_channel("rhel9", [(1, 16, 24050560)]))
+
+    assert store.changes(0, ram_tol=0, channel="rhel8")[0]["ram_kb"] == 24050000
+    assert [c["channel"] for c in store.changes(0)] == ["rhel9"]
+    assert store.changes(0, channel="rhel8") == []
+
+
+def test_failed_probe_is_not_a_change(store):
+    """
+    Tests that entries without hardware, from a failed probe, are neither
+    reported as changes nor compared with
+    """
+    record(store, 1 * DAY, make_channel("rhel8", [(1, 8, 24050560)]))
+    record(store, 2 * DAY, make_channel("rhel8", [(1, None, None)]))
+    record(store, 3 * DAY, make_channel("rhel8", [(1, 8, 24050560)]))
+    assert store.changes(0) == []
+
+    record(store, 4 * DAY, make_channel("rhel8", [(1, None, None)]))
+    record(store, 5 * DAY, make_channel("rhel8", [(1, 16, 24050560)]))
+    changes = store.changes(0)
+    assert [(c["ts"], c["cpus_before"], c["cpus"]) for c in changes] == [(5 * DAY, 8, 16)]
+
+
+def test_sweep_records_history(fake_request):
+    """
+    Tests that each daemon sweep records every host of the channel
+    """
+    store = HistoryStore(path=":memory:")
+    sweeper = daemon.Sweeper(
+        fake_context(cache=HwInfoCache(path=":memory:")), ["dummy-rhel8"], 60, store
+    )
+    sweeper.sweep("dummy-rhel8")
+    sweeper.sweep("dummy-rhel8")
+
+    rows = store.conn.execute("SELECT COUNT(*), COUNT(DISTINCT run_id) FROM host_hw")
+    assert rows.fetchone() == (30, 2)
+    assert store.changes(0) == []
@@ -0,0 +1,50 @@
+from kojichannelvalidator.hw_log import parse_hw_log
+from kojichannelvalidator.tests.util import HW_INFO_LOGS
+
+
+def log_for(arch):
+    """
+    Returns the fixture hw_info.log for an arch
+    """
+    return [log for url, log in HW_INFO_LOGS.items() if f"/{arch}/" in url][0]
+
+
+def test_parse_hw_log_x86_64():
+    """
+    Tests that parse_hw_log pulls every field out of the x86_64 fixture
+    """
+    assert parse_hw_log(log_for("x86_64")) == {
+        "cpus": 24,
+        "sockets": 2,
+        "threads_per_core": 2,
+        "model_name": "Intel(R) Xeon(R) CPU E5-2643 v3 @ 3.40GHz",
+        "ram_kb": 32624292,
+        "swap_kb": 16482300,
+        "disk": "581G",
+        "mount": "/",
+    }
+
+
+def test_parse_hw_log_inputs():
+    """
+    Tests that str, bytes and streamed bytes lines give the same result, and
+    that non numeric socket counts become None
+    """
+    log = log_for("aarch64")
+    expected = parse_hw_log(log)
+
+    assert parse_hw_log(log.encode()) == expected
+    assert parse_hw_log(line.encode() for line in log.split("\n")) == expected
+    assert expected["sockets"] is None
+    assert expected["mount"] == "/"
+    assert parse_hw_log(log_for("s390x"))["mount"] == "/mnt/build"
+
+
+def test_parse_hw_log_stops_after_storage():
+    """
+    Tests that a stream is not read past the end of the Storage section
+    """
+    lines = iter((log_for("ppc64le") + "\nextra\n/dev/sdb 1T\n").split("\n"))
+
+    assert parse_hw_log(lines)["disk"] == "198G"
+    assert list(lines) == ["extra", "/dev/sdb 1T", ""]
@@ -0,0 +1,57 @@
+import contextlib
+import io
+import os
+import subprocess
+import sys
+from kojichannelvalidator.__main__ import build_parser, cached_check
+from kojichannelvalidator.cache import HwInfoCache, result_key
+from kojichannelvalidator.tests.test_channel_validator import fake_profile, run_check
+
+PACKAGE_ROOT = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+
+
+def test_cached_check(tmp_path, monkeypatch, fake_request):
+    """
+    Tests that a check run with --cache is answered from the cache by an
+    identical check, and not by one with different options
+    """
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    fake_profile(monkeypatch)
+    options = ["-c", "dummy-rhel8", "--cache", "--result-ttl", "300"]
+    output = run_check(options)
+
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        status = cached_check(build_parser().parse_args(options + ["-j", "4"]))
+    assert status == 1
+    assert out.getvalue() == output
+
+    assert cached_check(build_parser().parse_args(options + ["-f", "json"])) is None
+    assert cached_check(build_parser().parse_args(options + ["-l"])) is None
+    assert cached_check(build_parser().parse_args(["-c", "dummy-rhel8", "--cache"])) is None
+
+
+def test_cache_hit_skips_heavy_imports(tmp_path):
+    """
+    Tests that a check answered from the cache does not import koji or
+    requests
+    """
+    env = dict(os.environ, XDG_CACHE_HOME=str(tmp_path), PYTHONPATH=PACKAGE_ROOT)
+    options = ["-c", "dummy-rhel8", "--cache", "--result-ttl", "300"]
+    cache = HwInfoCache(path=str(tmp_path / "kojichannelvalidator" / "cache.sqlite"))
+    cache.put_result(result_key(build_parser().parse_args(options)), "cached output\n", 0)
+    cache.close()
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "kojichannelvalidator", "check"] + options,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+
+    imported = {line.split("|")[-1].strip() for line in result.stderr.splitlines()}
+    assert result.returncode == 0
+    assert result.stdout == "cached output\n"
+    assert "koji" not in imported and "requests" not in imported
@@ -0,0 +1,71 @@
+import io
+import json
+import kojichannelvalidator.koji_channel_validator as cv
+from kojichannelvalidator.report import JsonReport, NdjsonReport, TextReport
+
+
+def make_channel():
+    """
+    Returns a validated channel with two hosts in one group and one host
+    without hardware information
+    """
+    channel = cv.Channel(name="dummy-rhel8", id=21)
+    for host_id, cpus in [(1, 8), (2, 8), (3, None)]:
+        host = cv.Host(f"host-{host_id}", host_id, True, "x86_64", None)
+        host.hw.cpus = cpus
+        host.hw.ram_kb = 16000000 if cpus != None else None
+        channel.host_list.append(host)
+    channel.config_check()
+    return channel
+
+
+def test_ndjson_report():
+    """
+    Tests that the ndjson report writes host, group and channel records
+    """
+    out = io.StringIO()
+    report = NdjsonReport(out)
+    channel = make_channel()
+    for host in channel.host_list:
+        report.host(host)
+    report.channel(channel, channel.is_valid())
+    report.finish([(channel, False)])
+
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+
+    assert [record["type"] for record in records] == ["host"] * 3 + [
+        "group",
+        "group",
+        "channel",
+    ]
+    assert records[0]["cpus"] == 8 and records[0]["arches"] == ["x86_64"]
+    assert records[3]["hosts"] == [1, 2]
+    assert records[-1]["valid"] is False
+
+
+def test_json_report():
+    """
+    Tests that the json report writes one document with every channel
+    """
+    out = io.StringIO()
+    report = JsonReport(out)
+    channel = make_channel()
+    report.channel(channel, True)
+    report.finish([(channel, True)])
+
+    document = json.loads(out.getvalue())
+
+    assert document["channels"][0]["groups"] == 2
+    assert [len(group) for group in document["channels"][0]["config_groups"]] == [2, 1]
+
+
+def test_text_report():
+    """
+    Tests the human readable report of a channel
+    """
+    out = io.StringIO()
+    TextReport(out).channel(make_channel(), True)
+
+    lines = out.getvalue().splitlines()
+    assert lines[0] == "dummy-rhel8 contains 3 hosts"
+    assert lines[4].startswith("ID: 1 arches: ['x86_64'] CPU(s): 8 Ram: 16000000")
@@ -0,0 +1,212 @@
+import threading
+import time
+import koji
+import pytest
+import requests
+import kojichannelvalidator.koji_channel_validator as cv
+from kojichannelvalidator.throttle import (
+    AimdLimiter,
+    RetryableError,
+    Throttle,
+    ThrottledSession,
+    TokenBucket,
+)
+from kojichannelvalidator.tests.util import FakeMultiCall, FakeSession
+
+
+class Flaky:
+    """Callable that fails with err the first failures times it is called"""
+
+    def __init__(self, failures, err):
+        self.failures = failures
+        self.err = err
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.err
+        return args
+
+
+def test_throttle_retries_then_succeeds():
+    """
+    Tests that retryable errors are retried and that the concurrency limit
+    is halved when the server pushes back
+    """
+    throttle = Throttle("hub", concurrency=8, retries=3, backoff=0)
+    flaky = Flaky(2, koji.ServerOffline("down for maintenance"))
+
+    assert throttle.call(flaky, 1, 2) == (1, 2)
+    assert flaky.calls == 3
+    assert throttle.limiter.limit < 8
+
+
+def test_throttle_gives_up():
+    """
+    Tests that a call is retried at most retries times and that errors that
+    cannot be retried are raised straight away
+    """
+    throttle = Throttle("hub", retries=2, backoff=0)
+    flaky = Flaky(5, RetryableError("503"))
+    with pytest.raises(RetryableError):
+        throttle.call(flaky)
+    assert flaky.calls == 3
+
+    flaky = Flaky(1, koji.GenericError("no such method"))
+    with pytest.raises(koji.GenericError):
+        throttle.call(flaky)
+    assert flaky.calls == 1
+
+
+def test_token_bucket_rate():
+    """
+    Tests that calls beyond the burst are spread out at the bucket's rate
+    """
+    bucket = TokenBucket(rate=200, burst=1)
+    start = time.monotonic()
+    for i in range(11):
+        bucket.acquire()
+
+    assert time.monotonic() - start >= 0.045
+
+
+def test_aimd_limiter_halves_once_per_push_back():
+    """
+    Tests that calls in flight when the limit was halved do not halve it
+    again, and that successes grow it back
+    """
+    limiter = AimdLimiter(maximum=8)
+    started = [limiter.acquire() for i in range(4)]
+    for call_started in started:
+        limiter.release(call_started, throttled=True)
+    assert limiter.limit == 4
+
+    for i in range(40):
+        limiter.release(limiter.acquire())
+    assert limiter.limit == 8
+
+
+def test_throttle_failures_do_not_grow_limit():
+    """
+    Tests that calls failing with errors that are not retried leave the
+    concurrency limit as it is
+    """
+    throttle = Throttle("hub", concurrency=8, backoff=0)
+    throttle.limiter.limit = 4
+    for i in range(20):
+        with pytest.raises(koji.GenericError):
+            throttle.call(Flaky(1, koji.GenericError("no such method")))
+
+    assert throttle.limiter.limit == 4
+
+
+def test_aimd_limiter_bounds_calls_in_flight():
+    """
+    Tests that no more than the limit of calls are in flight at once
+    """
+    throttle = Throttle("download", concurrency=3)
+    in_flight = []
+    lock = threading.Lock()
+
+    def call():
+        with lock:
+            in_flight.append(throttle.limiter.in_flight)
+        time.sleep(0.01)
+
+    threads = [threading.Thread(target=throttle.call, args=(call,)) for i in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(in_flight) <= 3
+
+
+def test_throttled_session_retries_hub_calls():
+    """
+    Tests that hub calls made through a ThrottledSession are retried
+    """
+    session = FakeSession()
+    session.getChannel = Flaky(1, requests.ConnectionError("reset"))
+    throttled = ThrottledSession(session, Throttle("hub", backoff=0))
+
+    assert throttled.getChannel("dummy-rhel8") == ("dummy-rhel8",)
+    assert session.getChannel.calls == 2
+
+
+def test_throttled_multicall_resends_calls():
+    """
+    Tests that a multicall that failed is sent again with every queued call
+    """
+    session = FakeSession()
+    failures = [requests.ConnectionError("reset")]
+
+    class MultiCall(FakeMultiCall):
+        def __exit__(self, _type, value, traceback):
+            if failures:
+                raise failures.pop()
+            return False
+
+    session.multicall = lambda **kwargs: MultiCall(session)
+    throttled = ThrottledSession(session, Throttle("hub", backoff=0))
+
+    with throttled.multicall() as m:
+        calls = [m.getBuildLogs(1757570), m.listHosts()]
+
+    assert session.multicalls == 2
+    assert [call.method for call in calls] == ["getBuildLogs", "listHosts"]
+    assert calls[0].result == FakeSession().getBuildLogs(1757570)
+
+
+def test_log_session_retries_server_errors(monkeypatch):
+    """
+    Tests that a download answered with a 503 is retried after the delay
+    the server asked for
+    """
+    statuses = [503, 200]
+
+    class Response:
+        def __init__(self, status_code):
+            self.status_code = status_code
+            self.headers = {"Retry-After": "0"}
+
+        def close(self):
+            pass
+
+    def fake_request(self, method, url, **kwargs):
+        return Response(statuses.pop(0))
+
+    monkeypatch.setattr(requests.Session, "request", fake_request)
+    http = cv.LogSession(retries=2)
+    http.throttle.backoff = 0
+
+    assert http.get("http://download.example.com/hw_info.log").status_code == 200
+    assert statuses == []
+
+
+def test_log_session_fetch_retries_body_errors(monkeypatch):
+    """
+    Tests that a download failing while its body is read is retried, and
+    that it holds its download slot until the body has been read
+    """
+    http = cv.LogSession(pool_size=4, retries=2)
+    http.throttle.backoff = 0
+    failures = [requests.exceptions.ChunkedEncodingError("connection broken")]
+    in_flight = []
+
+    class Response:
+        def iter_lines(self):
+            in_flight.append(http.throttle.limiter.in_flight)
+            if failures:
+                raise failures.pop()
+            yield b"CPU(s): 8"
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(requests.Session, "get", lambda self, url, **kwargs: Response())
+
+    assert http.fetch("http://download.example.com/hw_info.log", list) == [b"CPU(s): 8"]
+    assert in_flight == [1, 1]
+    assert http.throttle.limiter.in_flight == 0
@@ -0,0 +1,44 @@
+import json
+from kojichannelvalidator.timing import Timings, TimedSession
+from kojichannelvalidator.tests.util import FakeSession
+
+
+def test_summary_percentiles():
+    """
+    Tests the count, total, percentiles and slowest hosts of a summary
+    """
+    timings = Timings()
+    for seconds in range(1, 21):
+        timings.record("hub.listTasks", float(seconds), host_id=seconds % 2)
+
+    row = timings.summary()["hub.listTasks"]
+
+    assert row["count"] == 20
+    assert row["total"] == 210.0
+    assert row["p50"] == 10.0
+    assert row["p95"] == 19.0
+    assert row["max"] == 20.0
+    assert row["slowest_hosts"] == [(0, 110.0), (1, 100.0)]
+
+
+def test_timed_session_labels_hub_calls(tmp_path):
+    """
+    Tests that hub calls made while probing a host are labelled with the
+    method and host id, and that nothing is recorded while disabled
+    """
+    timings = Timings()
+    session = TimedSession(FakeSession(), timings)
+    session.listChannels()
+    assert timings.summary() == {}
+
+    timings.enabled = True
+    with timings.host(94):
+        session.listHosts()
+        with session.multicall() as m:
+            m.listBuilds(taskID=1)
+    timings.write_json(str(tmp_path / "timings.json"))
+
+    summary = json.load(open(tmp_path / "timings.json"))
+    assert summary["hub.listHosts"]["count"] == 1
+    assert summary["hub.listHosts"]["slowest_hosts"][0][0] == 94
+    assert summary["hub.multicall"]["count"] == 1
@@ -0,0 +1,281 @@
+import functools
+import logging
+import random
+import threading
+import time
+import koji
+import requests
+from kojichannelvalidator.defaults import BACKOFF, MAX_BACKOFF, RETRIES
+
+# HTTP statuses meaning the server is overloaded or briefly unavailable
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RetryableError(Exception):
+    """
+    Raised for a response that should be retried, such as a 503. retry_after
+    is the delay the server asked for, if any.
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def retry_after(response):
+    """
+    Returns the seconds to wait given in a response's Retry-After header, or
+    None if it has none in seconds
+    """
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def is_retryable(err):
+    """
+    Returns True if a call that raised err should be retried
+    """
+    if isinstance(
+        err,
+        (
+            RetryableError,
+            koji.ServerOffline,
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+        ),
+    ):
+        return True
+    if isinstance(err, requests.HTTPError) and err.response != None:
+        return err.response.status_code in RETRY_STATUSES
+    return False
+
+
+class TokenBucket:
+    """
+    Allows rate calls a second on average and bursts of up to burst calls.
+    Calls that find the bucket empty reserve a token and sleep until it is
+    due, so waiting calls are let through in order. A rate of None allows
+    any number of calls.
+    """
+
+    def __init__(self, rate=None, burst=None):
+        self.rate = rate
+        self.burst = burst if burst != None else max(rate or 1, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+
+class AimdLimiter:
+    """
+    Bounds the calls in flight with an additive increase, multiplicative
+    decrease limit. The limit grows by one for each limit calls that succeed
+    and is halved when the server pushes back, staying between 1 and
+    maximum. Calls already in flight when the limit was halved do not halve
+    it again. A maximum of None does not bound calls.
+    """
+
+    def __init__(self, maximum=None):
+        self.maximum = maximum
+        self.limit = maximum
+        self.in_flight = 0
+        self.decreased = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Waits for a free slot. returns the time the call started
+        """
+        started = time.monotonic()
+        if self.maximum == None:
+            return started
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+        return started
+
+    def release(self, started, throttled=False, failed=False):
+        """
+        Frees the slot of a call that started at started. The limit grows if
+        the call succeeded, is halved if the server pushed back and is left
+        as it is if the call failed for any other reason.
+        """
+        if self.maximum == None:
+            return
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                if started >= self.decreased:
+                    self.limit = max(self.limit / 2, 1)
+                    self.decreased = time.monotonic()
+                    logging.info(
+                        f"Server pushed back, limiting to {int(self.limit)} calls"
+                    )
+            elif not failed:
+                self.limit = min(self.limit + 1 / self.limit, self.maximum)
+            self.condition.notify_all()
+
+
+class Throttle:
+    """
+    Rate limit, adaptive concurrency limit and retries for the calls made to
+    one endpoint, shared by every thread calling it. Failed calls that can
+    be retried are retried up to retries times after an exponential backoff
+    with full jitter, or after the delay the server asked for.
+    """
+
+    def __init__(
+        self,
+        name,
+        rate=None,
+        burst=None,
+        concurrency=None,
+        retries=RETRIES,
+        backoff=BACKOFF,
+        max_backoff=MAX_BACKOFF,
+    ):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.limiter = AimdLimiter(concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt, retry_after=None):
+        """
+        Returns the seconds to wait before retrying after attempt failed
+        """
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+        if retry_after != None:
+            delay = max(delay, min(retry_after, self.max_backoff))
+        return delay
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Calls fn with args and kwargs, within the limits and with retries
+        """
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            started = self.limiter.acquire()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as err:
+                if not is_retryable(err):
+                    self.limiter.release(started, failed=True)
+                    raise
+                self.limiter.release(started, throttled=True)
+                if attempt >= self.retries:
+                    raise
+                asked = getattr(err, "retry_after", None)
+                if asked == None and getattr(err, "response", None) != None:
+                    asked = retry_after(err.response)
+                delay = self.delay(attempt, asked)
+                logging.warning(
+                    f"{self.name} call failed, retry {attempt + 1}/{self.retries} in {delay:.1f}s: {err}"
+                )
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.limiter.release(started)
+            return result
+
+
+class QueuedCall:
+    """
+    Call queued in a ThrottledMultiCall. Its result is that of the koji call
+    it was last sent as.
+    """
+
+    __slots__ = ("method", "args", "kwargs", "call")
+
+    def __init__(self, method, args, kwargs):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.call = None
+
+    @property
+    def result(self):
+        return self.call.result
+
+
+class ThrottledMultiCall:
+    """
+    Multicall whose calls are sent through a Throttle when it exits. Calls
+    are queued here rather than in a koji multicall, and each attempt sends
+    them in a new multicall from new_multicall, so a failed multicall can be
+    sent again.
+    """
+
+    def __init__(self, new_multicall, throttle):
+        self.new_multicall = new_multicall
+        self.throttle = throttle
+        self.calls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _type, value, traceback):
+        if _type != None:
+            return False
+
+        def send():
+            with self.new_multicall() as multicall:
+                for queued in self.calls:
+                    method = getattr(multicall, queued.method)
+                    queued.call = method(*queued.args, **queued.kwargs)
+
+        self.throttle.call(send)
+        return False
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            queued = QueuedCall(name, args, kwargs)
+            self.calls.append(queued)
+            return queued
+
+        return call
+
+
+class ThrottledSession:
+    """
+    Wraps a koji ClientSession so every hub call goes through a Throttle
+    """
+
+    def __init__(self, session, throttle):
+        self.session = session
+        self.throttle = throttle
+
+    def multicall(self, **kwargs):
+        return ThrottledMultiCall(
+            functools.partial(self.session.multicall, **kwargs), self.throttle
+        )
+
+    def __getattr__(self, name):
+        attr = getattr(self.session, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return self.throttle.call(attr, *args, **kwargs)
+
+        return call
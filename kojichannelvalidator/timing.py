@@ -0,0 +1,186 @@
+import contextlib
+import json
+import math
+import threading
+import time
+
+
+def percentile(sorted_values, fraction):
+    """
+    Returns the nearest rank percentile of an already sorted list
+    """
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+class Timings:
+    """
+    Collects how long each hub call, download and phase of a run takes,
+    labelled by what was timed and the host it was for. Timing is off until
+    enabled is set, so the instrumentation costs next to nothing by default.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.samples = {}
+
+    def reset(self):
+        with self.lock:
+            self.samples = {}
+
+    def record(self, label, seconds, host_id=None):
+        """
+        Records one sample for label
+        """
+        with self.lock:
+            self.samples.setdefault(label, []).append((seconds, host_id))
+
+    @contextlib.contextmanager
+    def timed(self, label, host_id=None):
+        """
+        Times the body of a with statement under label. If host_id is not
+        given, the host set with host() in this thread is used.
+        """
+        if not self.enabled:
+            yield
+            return
+        if host_id == None:
+            host_id = getattr(self.local, "host_id", None)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(label, time.perf_counter() - start, host_id)
+
+    def timed_iter(self, label, items):
+        """
+        Yields from items, recording the time spent waiting for them as one
+        sample under label once they run out. Used to time a generator that
+        is consumed by something else, such as hosts streamed into a probe.
+        """
+        if not self.enabled:
+            yield from items
+            return
+        elapsed = 0.0
+        iterator = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                elapsed += time.perf_counter() - start
+            yield item
+        self.record(label, elapsed)
+
+    @contextlib.contextmanager
+    def host(self, host_id):
+        """
+        Labels everything timed in this thread within the with statement as
+        being for host_id
+        """
+        previous = getattr(self.local, "host_id", None)
+        self.local.host_id = host_id
+        try:
+            yield
+        finally:
+            self.local.host_id = previous
+
+    def summary(self, slowest=3):
+        """
+        returns a dict of label to count, total, p50, p95 and max seconds and
+        the slowest hosts for that label
+        """
+        with self.lock:
+            samples = {label: list(values) for label, values in self.samples.items()}
+
+        summary = {}
+        for label, values in sorted(samples.items()):
+            seconds = sorted(value[0] for value in values)
+            by_host = {}
+            for value, host_id in values:
+                if host_id != None:
+                    by_host[host_id] = by_host.get(host_id, 0) + value
+            summary[label] = {
+                "count": len(seconds),
+                "total": sum(seconds),
+                "p50": percentile(seconds, 0.50),
+                "p95": percentile(seconds, 0.95),
+                "max": seconds[-1],
+                "slowest_hosts": sorted(
+                    by_host.items(), key=lambda item: item[1], reverse=True
+                )[:slowest],
+            }
+        return summary
+
+    def format_summary(self):
+        """
+        returns the summary as a text table
+        """
+        lines = [
+            f"{'phase':<28}{'count':>8}{'total s':>10}{'p50 s':>9}{'p95 s':>9}{'max s':>9}  slowest hosts"
+        ]
+        for label, row in self.summary().items():
+            slowest = ", ".join(
+                f"{host_id} ({seconds:.3f}s)" for host_id, seconds in row["slowest_hosts"]
+            )
+            lines.append(
+                f"{label:<28}{row['count']:>8}{row['total']:>10.3f}{row['p50']:>9.3f}{row['p95']:>9.3f}{row['max']:>9.3f}  {slowest}"
+            )
+        return "\n".join(lines)
+
+    def write_json(self, path):
+        """
+        Writes the summary to path as JSON
+        """
+        with open(path, "w") as fp:
+            json.dump(self.summary(), fp, indent=2)
+
+
+class TimedMultiCall:
+    """
+    Wraps a koji multicall so the calls sent when it exits are timed
+    """
+
+    def __init__(self, multicall, timings):
+        self.multicall = multicall
+        self.timings = timings
+
+    def __enter__(self):
+        return self.multicall.__enter__()
+
+    def __exit__(self, _type, value, traceback):
+        with self.timings.timed("hub.multicall"):
+            return self.multicall.__exit__(_type, value, traceback)
+
+
+class TimedSession:
+    """
+    Wraps a koji ClientSession so every hub call is timed, labelled by its
+    method name
+    """
+
+    def __init__(self, session, timings):
+        self.session = session
+        self.timings = timings
+
+    def multicall(self, **kwargs):
+        return TimedMultiCall(self.session.multicall(**kwargs), self.timings)
+
+    def __getattr__(self, name):
+        attr = getattr(self.session, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with self.timings.timed(f"hub.{name}"):
+                return attr(*args, **kwargs)
+
+        return call
+
+
+# Timings shared by the whole run
+TIMINGS = Timings()
@@ -19,6 +19,9 @@ setup(
         "requests",
         "koji"
       ],
+  extras_require={
+        "numpy": ["numpy"]
+      },
   classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",